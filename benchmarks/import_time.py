@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+'''
+Startup benchmark of bungiesearch: measures, each in a fresh interpreter where Django and its ORM are already loaded, the time taken by
+importing the package with the manager used to declare models, by setting up Django and declaring a model with a BungiesearchManager,
+and by the first access to the Bungiesearch class, which imports elasticsearch, elasticsearch-dsl-py and the index fields.
+Each is measured without and with SIGNALS in the settings, since signal processors are set up when models are declared.
+Reports the median of each time over 21 runs by default.
+Usage: python benchmarks/import_time.py [number of runs]
+'''
+import json
+import os
+import subprocess
+import sys
+
+CONFIGS = [('default settings', {}), ('SIGNALS set', {'SIGNALS': {}})]
+
+SNIPPET = '''
+import json
+import sys
+import time
+from django.conf import settings
+settings.configure(INSTALLED_APPS=['bungiesearch'], BUNGIESEARCH=dict({'URLS': ['localhost'], 'INDICES': {}}, **json.loads(sys.argv[1])))
+import django
+import django.db.models
+import django.urls  # Imported by django.setup() whichever the installed apps.
+import django.utils.log
+
+start = time.time()
+import bungiesearch
+import bungiesearch.managers
+imported = time.time()
+django.setup()
+
+
+class Benchmark(django.db.models.Model):
+    objects = bungiesearch.managers.BungiesearchManager()
+
+    class Meta:
+        app_label = 'bungiesearch'
+declared = time.time()
+bungiesearch.Bungiesearch
+print('{} {} {}'.format(imported - start, declared - imported, time.time() - declared))
+'''
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(runs=21):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__))), os.environ.get('PYTHONPATH', '')]))
+    env.pop('DJANGO_SETTINGS_MODULE', None)
+    for name, config in CONFIGS:
+        imports, startups, first_uses = [], [], []
+        for _ in range(runs):
+            import_time, startup_time, first_use_time = subprocess.check_output([sys.executable, '-c', SNIPPET, json.dumps(config)], env=env).split()
+            imports.append(float(import_time))
+            startups.append(float(startup_time))
+            first_uses.append(float(first_use_time))
+
+        print('{}:'.format(name))
+        print('  import bungiesearch (with managers):           {:.1f} ms'.format(median(imports) * 1000))
+        print('  django.setup() and declaring a managed model:  {:.1f} ms'.format(median(startups) * 1000))
+        print('  first access to bungiesearch.Bungiesearch:      {:.1f} ms'.format(median(first_uses) * 1000))
+    print('(medians of {} runs)'.format(runs))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
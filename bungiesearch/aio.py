@@ -0,0 +1,80 @@
+'''
+Asyncio support, which requires Python 3.5 or later.
+
+The elasticsearch-py 2.x client does not have an asynchronous transport, so searches and indexing run on a thread pool
+executor, which keeps the event loop free while waiting on elasticsearch and on the database. The executor threads share
+the elasticsearch clients (see `Bungiesearch.get_connection`), whose connection pools are thread safe.
+'''
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .utils import delete_index_item, update_index
+
+_executor_lock = Lock()
+_executor = {}
+
+
+def get_executor():
+    '''
+    Returns the executor of the blocking operations, whose size is set by BUNGIESEARCH['ASYNC_THREADS'] (defaults to 10).
+    The executor is created lazily, and again after a fork since threads do not survive it.
+    '''
+    pid = os.getpid()
+    if _executor.get('pid') != pid:
+        with _executor_lock:
+            if _executor.get('pid') != pid:
+                _executor['executor'] = ThreadPoolExecutor(settings.BUNGIESEARCH.get('ASYNC_THREADS', 10))
+                _executor['pid'] = pid
+    return _executor['executor']
+
+
+def _call(func, args, kwargs):
+    # Executor threads are not request threads: their database connections are closed according to CONN_MAX_AGE.
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args, **kwargs):
+    '''
+    Runs a blocking function on the executor and returns its result.
+    '''
+    return await asyncio.get_event_loop().run_in_executor(get_executor(), partial(_call, func, args, kwargs))
+
+
+async def execute_async(search):
+    '''
+    Executes the search, mapping its results to model instances unless raw results were requested, and returns the results.
+    '''
+    if search.results:
+        return search.results
+    return await run_blocking(search.execute)
+
+
+async def count_async(search):
+    '''
+    Returns the number of hits of the search.
+    '''
+    return await run_blocking(search.count)
+
+
+async def update_index_async(model_items, model_name, **kwargs):
+    '''
+    Asynchronous version of `bungiesearch.utils.update_index`, which accepts the same arguments.
+    '''
+    return await run_blocking(update_index, model_items, model_name, **kwargs)
+
+
+async def delete_index_item_async(item, model_name, refresh=True):
+    '''
+    Asynchronous version of `bungiesearch.utils.delete_index_item`.
+    '''
+    return await run_blocking(delete_index_item, item, model_name, refresh=refresh)
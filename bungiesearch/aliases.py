@@ -1,3 +1,95 @@
+from elasticsearch_dsl.query import Query
+from elasticsearch_dsl.search import Search
+from six import iteritems
+
+
+class Param(object):
+    '''
+    Placeholder for a parameter of a SearchTemplate, replaced by the value of the parameter of the same name when rendered.
+    '''
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Param({!r})'.format(self.name)
+
+
+class SearchTemplate(object):
+    '''
+    A search request body containing `Param` placeholders. The body is compiled to a dictionary once, when first rendered,
+    and each rendering only copies its containers while filling in the parameters, instead of rebuilding and serializing
+    elasticsearch-dsl-py objects on every call.
+    '''
+    def __init__(self, body):
+        '''
+        :param body: request body as a dictionary, an elasticsearch-dsl-py query or an elasticsearch-dsl-py search.
+        '''
+        self.body = body
+        self._compiled = None
+        self.params = None
+
+    def compile(self):
+        '''
+        Returns the request body as a dictionary, and sets `params` to the names of its parameters.
+        '''
+        if self._compiled is None:
+            body = self.body
+            if isinstance(body, Query):
+                body = {'query': body.to_dict()}
+            elif isinstance(body, Search):
+                body = body.to_dict()
+            params = set()
+            self._compiled = self._compile(body, params)
+            self.params = frozenset(params)
+        return self._compiled
+
+    def _compile(self, node, params):
+        if isinstance(node, dict):
+            return dict((key, self._compile(value, params)) for key, value in iteritems(node))
+        if isinstance(node, (list, tuple)):
+            return [self._compile(value, params) for value in node]
+        if hasattr(node, 'to_dict'):
+            return self._compile(node.to_dict(), params)
+        if isinstance(node, Param):
+            params.add(node.name)
+        return node
+
+    def render(self, **params):
+        '''
+        Returns a new request body where each placeholder is replaced by the value of its parameter.
+        :raise TypeError: if a parameter is missing or unexpected.
+        '''
+        compiled = self.compile()
+        if set(params) != self.params:
+            missing, unexpected = sorted(self.params - set(params)), sorted(set(params) - self.params)
+            raise TypeError('Search template expected parameters {}, missing: {}, unexpected: {}.'.format(sorted(self.params), missing, unexpected))
+        return _fill(compiled, params)
+
+
+def _fill(node, params):
+    if isinstance(node, dict):
+        return dict((key, _fill(value, params)) for key, value in iteritems(node))
+    if isinstance(node, list):
+        return [_fill(value, params) for value in node]
+    if isinstance(node, Param):
+        return params[node.name]
+    return node
+
+
+def combine_bodies(first, second):
+    '''
+    Returns the request body combining two bodies: their queries and post filters must both match, and the other
+    keys of the second body take precedence.
+    '''
+    body = dict(first)
+    for key, value in iteritems(second):
+        if key in ('query', 'post_filter') and key in body:
+            body[key] = {'bool': {'must': [body[key], value]}}
+        else:
+            body[key] = value
+    return body
+
+
 class SearchAlias(object):
     '''
     Defines search aliases for specific models. Essentially works like Django Managers but for Bungiesearch.
@@ -13,9 +105,11 @@ class SearchAlias(object):
         except AttributeError:
             self._applicable_models = []
             self.alias_name = self._classname.lower()
+            self.cache_timeout = None
         else:
             self._applicable_models = getattr(_meta, 'models', None)
             self.alias_name = getattr(_meta, 'alias_name', self._classname.lower())
+            self.cache_timeout = getattr(_meta, 'cache_timeout', None)
         self.search_instance = None
         self.model = None
 
@@ -24,6 +118,7 @@ class SearchAlias(object):
         s._classname = self._classname
         s._applicable_models = self._applicable_models
         s.alias_name = self.alias_name
+        s.cache_timeout = self.cache_timeout
         return s
 
     def prepare(self, search_instance, model_obj):
@@ -32,7 +127,11 @@ class SearchAlias(object):
         s.model = model_obj
         return s
 
+    template = None # SearchTemplate rendered by the default `alias_for`.
+
     def alias_for(self, **kwargs):
+        if self.template is not None:
+            return self.search_instance.template(self.template, **kwargs)
         raise NotImplementedError('{} does not provide an implementation for alias_for.'.format(self._classname))
 
     def get_model(self):
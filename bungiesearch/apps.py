@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class BungiesearchConfig(AppConfig):
+    name = 'bungiesearch'
+
+    def ready(self):
+        # Web and worker processes may load all the indices and aliases at startup, instead of on their first search.
+        # Otherwise, when signals are processed, the indices are loaded on the first change of any model (cf. `dependency_loader`).
+        if settings.BUNGIESEARCH.get('EAGER_LOAD'):
+            from . import Bungiesearch
+            Bungiesearch.__load_settings__()
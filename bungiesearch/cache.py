@@ -0,0 +1,197 @@
+import json
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock
+from time import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from six import iteritems, text_type
+from six.moves import cPickle as pickle
+
+
+class LocalCache(object):
+    '''
+    A thread-safe, in process, least recently used cache with per entry expiry.
+    Implements the subset of the Django cache API used by Bungiesearch, with the same timeout semantics:
+    a timeout of None never expires, and a timeout of 0 does not cache. Values are pickled, so that callers never share mutable objects.
+    '''
+    def __init__(self, max_entries=1000, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get_many(self, keys):
+        now = time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                try:
+                    expires, value = self._entries.pop(key)
+                except KeyError:
+                    continue
+                if expires is not None and expires < now:
+                    continue
+                self._entries[key] = (expires, value) # Moves the key to the most recently used end.
+                found[key] = value
+        return dict((key, pickle.loads(value)) for key, value in iteritems(found))
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.set_many({key: value}, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        if timeout is not None and timeout <= 0:
+            self.delete_many(list(data))
+            return
+        expires = time() + timeout if timeout is not None else None
+        pickled = [(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for key, value in iteritems(data)]
+        with self._lock:
+            for key, value in pickled:
+                self._entries.pop(key, None)
+                self._entries[key] = (expires, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def build_cache(cache_settings):
+    '''
+    Returns a cache as configured in a Bungiesearch cache setting: a LocalCache if BACKEND is 'local' (the default),
+    or the Django cache named by CACHE_ALIAS if BACKEND is 'django'.
+    '''
+    if cache_settings.get('BACKEND', 'local') == 'django':
+        return caches[cache_settings.get('CACHE_ALIAS', 'default')]
+    return LocalCache(max_entries=cache_settings.get('MAX_ENTRIES', 1000), timeout=cache_settings.get('TIMEOUT', 300))
+
+
+_caches_lock = Lock()
+_caches = {}
+
+
+def get_cache(setting_name):
+    '''
+    Returns the cache configured by BUNGIESEARCH[setting_name], or None if it is not set. Caches are built once.
+    '''
+    cache_settings = settings.BUNGIESEARCH.get(setting_name)
+    if cache_settings is None:
+        return None
+    if setting_name not in _caches:
+        with _caches_lock:
+            if setting_name not in _caches:
+                _caches[setting_name] = build_cache(cache_settings)
+    return _caches[setting_name]
+
+
+def get_instance_cache():
+    '''
+    Returns the cache of mapped model instances, or None if BUNGIESEARCH['INSTANCE_CACHE'] is not set.
+    '''
+    return get_cache('INSTANCE_CACHE')
+
+
+def get_result_cache():
+    '''
+    Returns the cache of search responses, or None if BUNGIESEARCH['RESULT_CACHE'] is not set.
+    '''
+    return get_cache('RESULT_CACHE')
+
+
+def instance_cache_key(model, pk):
+    return 'bungiesearch:instance:{}.{}:{}'.format(model._meta.app_label, model._meta.model_name, pk)
+
+
+def get_cached_instances(model, pks):
+    '''
+    Returns a dictionary of primary key to cached model instance, for those of the provided primary keys which are cached.
+    '''
+    cache = get_instance_cache()
+    if cache is None:
+        return {}
+    keys = dict((instance_cache_key(model, pk), pk) for pk in pks)
+    return dict((keys[key], item) for key, item in iteritems(cache.get_many(list(keys))))
+
+
+def cache_instances(model, items):
+    '''
+    Caches the provided model instances, which must have been fetched with all their fields.
+    '''
+    cache = get_instance_cache()
+    if cache is not None and items:
+        cache.set_many(dict((instance_cache_key(model, item.pk), item) for item in items),
+                       settings.BUNGIESEARCH['INSTANCE_CACHE'].get('TIMEOUT', 300))
+
+
+def invalidate_instances(model, pks):
+    '''
+    Removes the provided primary keys of the model from the instance cache.
+    '''
+    cache = get_instance_cache()
+    if cache is not None:
+        cache.delete_many([instance_cache_key(model, pk) for pk in pks])
+
+
+def invalidate_instance(sender, instance, **kwargs):
+    '''
+    Signal receiver which removes a saved or deleted model instance from the instance cache.
+    '''
+    invalidate_instances(sender, [instance.pk])
+
+
+def generation_cache_key(index_name):
+    return 'bungiesearch:generation:{}'.format(index_name)
+
+
+def get_index_generations(cache, index_names):
+    '''
+    Returns the current generation of each of the provided indices. Indices without a generation (never updated, or evicted
+    from the cache) get a new one, so that previously cached results are never used again.
+    '''
+    keys = [generation_cache_key(index_name) for index_name in index_names]
+    generations = cache.get_many(keys)
+    missing = dict((key, uuid4().hex) for key in keys if key not in generations)
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+def result_cache_key(cache, search_data, index_names):
+    '''
+    Returns the result cache key of a search, a stable hash of the search data and of the generations of the searched indices.
+    :param search_data: JSON serializable description of the search, e.g. its body, indices, doc types and parameters.
+    '''
+    data = json.dumps([search_data, get_index_generations(cache, index_names)], sort_keys=True, default=text_type)
+    return 'bungiesearch:result:{}'.format(sha1(data.encode('utf-8')).hexdigest())
+
+
+def get_result_cache_timeout():
+    return settings.BUNGIESEARCH['RESULT_CACHE'].get('TIMEOUT', 60)
+
+
+def get_count_cache_timeout():
+    return settings.BUNGIESEARCH['RESULT_CACHE'].get('COUNT_TIMEOUT', 10)
+
+
+def invalidate_results(index_names):
+    '''
+    Starts a new generation of the provided indices, so that the cached results of searches on these indices are not used anymore.
+    '''
+    cache = get_result_cache()
+    if cache is not None and index_names:
+        cache.set_many(dict((generation_cache_key(index_name), uuid4().hex) for index_name in index_names), None)
@@ -0,0 +1,126 @@
+import os
+import time
+import zlib
+from threading import Lock
+
+import urllib3
+from elasticsearch.compat import urlencode
+from elasticsearch.connection import Urllib3HttpConnection
+from elasticsearch.exceptions import ConnectionError, ConnectionTimeout, SSLError
+from urllib3.exceptions import ReadTimeoutError, SSLError as UrllibSSLError
+
+
+class CompressedHttpConnection(Urllib3HttpConnection):
+    '''
+    Connection which gzips request bodies of at least `compress_threshold` bytes (in practice bulk requests), and accepts
+    gzipped responses (sent by elasticsearch if `http.compression` is enabled on the cluster).
+    :param compress_threshold: minimum size in bytes of the bodies to compress, since compressing small bodies saves little.
+    :param compress_level: zlib compression level, from 1 (fastest) to 9 (smallest).
+    '''
+    def __init__(self, compress_threshold=1024, compress_level=6, **kwargs):
+        super(CompressedHttpConnection, self).__init__(**kwargs)
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.headers.update(urllib3.make_headers(accept_encoding=True))
+        self.compressed_headers = dict(self.headers, **{'content-encoding': 'gzip'})
+
+    def compress(self, body):
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # Gzip format.
+        return compressor.compress(body) + compressor.flush()
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=()):
+        if body is None or len(body) < self.compress_threshold:
+            return super(CompressedHttpConnection, self).perform_request(method, url, params=params, body=body, timeout=timeout, ignore=ignore)
+
+        # Same as Urllib3HttpConnection.perform_request, sending the compressed body (the original body is logged).
+        url = self.url_prefix + url
+        if params:
+            url = '%s?%s' % (url, urlencode(params))
+        full_url = self.host + url
+
+        start = time.time()
+        try:
+            kw = {}
+            if timeout:
+                kw['timeout'] = timeout
+            if not isinstance(url, str):
+                url = url.encode('utf-8')
+            if not isinstance(method, str):
+                method = method.encode('utf-8')
+
+            response = self.pool.urlopen(method, url, self.compress(body), retries=False, headers=self.compressed_headers, **kw)
+            duration = time.time() - start
+            raw_data = response.data.decode('utf-8')
+        except UrllibSSLError as e:
+            self.log_request_fail(method, full_url, body, time.time() - start, exception=e)
+            raise SSLError('N/A', str(e), e)
+        except ReadTimeoutError as e:
+            self.log_request_fail(method, full_url, body, time.time() - start, exception=e)
+            raise ConnectionTimeout('TIMEOUT', str(e), e)
+        except Exception as e:
+            self.log_request_fail(method, full_url, body, time.time() - start, exception=e)
+            raise ConnectionError('N/A', str(e), e)
+
+        if not (200 <= response.status < 300) and response.status not in ignore:
+            self.log_request_fail(method, url, body, duration, response.status, raw_data)
+            self._raise_error(response.status, raw_data)
+
+        self.log_request_success(method, full_url, url, body, response.status, raw_data, duration)
+        return response.status, response.getheaders(), raw_data
+
+
+def get_connection_settings(es_settings):
+    '''
+    Returns the keyword arguments of the elasticsearch client from the elasticsearch settings, where `http_compress`
+    set to True selects the CompressedHttpConnection (unless `connection_class` is set).
+    '''
+    if 'http_compress' not in es_settings:
+        return es_settings
+    es_settings = dict(es_settings)
+    if es_settings.pop('http_compress'):
+        es_settings.setdefault('connection_class', CompressedHttpConnection)
+    else:
+        es_settings.pop('compress_threshold', None)
+        es_settings.pop('compress_level', None)
+    return es_settings
+
+
+class ConnectionRegistry(object):
+    '''
+    Thread-safe registry of elasticsearch clients, which share their connection pools between all the searches with the same
+    connection settings. The registry is emptied in a forked process (e.g. a gunicorn or celery worker), so that children
+    build their own clients instead of sharing the sockets opened by their parent.
+    '''
+    def __init__(self):
+        self._lock = Lock()
+        self._pid = os.getpid()
+        self._clients = {}
+
+    def get(self, key, factory, force_new=False):
+        '''
+        Returns the client registered with the key, first building and registering it with `factory` if it does not exist yet
+        (or if `force_new` is set).
+        '''
+        pid = os.getpid()
+        if self._pid != pid:
+            # Threads do not survive a fork, so the lock may be held by a thread of the parent which does not exist anymore.
+            self._lock = Lock()
+            self._clients = {}
+            self._pid = pid
+        if not force_new:
+            client = self._clients.get(key)
+            if client is not None:
+                return client
+
+        with self._lock:
+            client = None if force_new else self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = factory()
+        return client
+
+    def clear(self):
+        '''
+        Forgets all the clients, whose connections are closed once they are not used anymore.
+        '''
+        with self._lock:
+            self._clients = {}
@@ -1,9 +1,6 @@
-from distutils.version import StrictVersion
-
-from django import get_version as get_django_version
-from django.template import Context, loader
-from django.template.defaultfilters import striptags
+from django import VERSION as django_version
 from django.utils.functional import cached_property
+from django.utils.html import strip_tags
 from six import iteritems, text_type, python_2_unicode_compatible
 
 from elasticsearch_dsl.analysis import Analyzer
@@ -110,8 +107,10 @@ class AbstractField(object):
 
     def get_object_value(self, obj):
         if self.template_name:
+            # Imported here since loading the template engine is only needed by template fields.
+            from django.template import Context, loader
             context = {'object': obj}
-            if StrictVersion(get_django_version()) < StrictVersion('1.7'):
+            if django_version < (1, 7):
                 context = Context(context)
 
             t = loader.select_template([self.template_name])
@@ -181,7 +180,7 @@ class StringField(AbstractField):
         val = super(StringField, self).value(obj)
         if val is None:
             return None
-        return striptags(val)
+        return strip_tags(text_type(val))
 
 
 class NumberField(AbstractField):
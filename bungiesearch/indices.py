@@ -1,8 +1,11 @@
+from django import VERSION as django_version
+from django.conf import settings
+from django.db import router
 from six import iteritems, text_type
 
 from elasticsearch_dsl.analysis import Analyzer
 
-from .fields import AbstractField, django_field_to_index
+from .fields import AbstractField, StringField, django_field_to_index
 from .logger import logger
 
 
@@ -18,7 +21,7 @@ class ModelIndex(object):
     1. Create a class which inherits from ModelIndex.
     2. Define custom indexed fields as class attributes. Values must be instances AbstractField. Important info in 3b.
     3. Define a `Meta` subclass, which must contain at least `model` as a class attribute.
-        a. Optional class attributes: `fields`, `excludes` and `additional_fields`.
+        a. Optional class attributes: `fields`, `excludes`, `additional_fields`, `depends_on` and `indexing_filter`.
         b. If custom indexed field requires model attributes which are not in the difference between `fields` and `excludes`, these must be defined in `additional_fields`.
     '''
     def __init__(self):
@@ -41,6 +44,9 @@ class ModelIndex(object):
         self.optimize_queries = getattr(_meta, 'optimize_queries', False)
         self.is_default = getattr(_meta, 'default', True)
         self.indexing_query = getattr(_meta, 'indexing_query', None)
+        self.depends_on = getattr(_meta, 'depends_on', {})
+        self.indexing_filter = getattr(_meta, 'indexing_filter', None)
+        self.hydrate_from_source = getattr(_meta, 'hydrate_from_source', False)
 
         # Add in fields from the model.
         self.fields.update(self._get_fields(fields, excludes, hotfixes))
@@ -58,6 +64,9 @@ class ModelIndex(object):
             self.fields[cls_attr] = obj
 
         self.fields['_id'] = self.fields[id_field]
+        self.id_field = id_field
+        self.source_fields, self.source_string_fields = self._get_source_fields()
+        self._only_fields = {}
 
     def matches_indexing_condition(self, item):
         '''
@@ -68,6 +77,48 @@ class ModelIndex(object):
     def get_model(self):
         return self.model
 
+    def get_only_fields(self, desired_fields):
+        '''
+        Returns the names of the model fields to pass to `QuerySet.only()` in order to only fetch the desired fields.
+        The result is computed once per set of desired fields.
+
+        :param desired_fields: iterable of field names, which may include names which are not model fields.
+        '''
+        key = frozenset(desired_fields)
+        if key not in self._only_fields:
+            # For complete backwards compatibility, you may want to exclude GenericForeignKey from the results.
+            self._only_fields[key] = [field.name for field in self.model._meta.get_fields()
+                                      if field.name in key and not (field.many_to_one and field.related_model is None)]
+        return self._only_fields[key]
+
+    def instance_from_source(self, result):
+        '''
+        Builds a model instance from the document stored in elasticsearch, without querying the database.
+        Model fields which are not stored in the document are deferred, hence only fetched from the database if accessed.
+
+        :param result: elasticsearch-dsl-py result, whose `_source` contains the serialized object.
+        :return: the model instance, or None if it cannot be built from this document.
+        '''
+        if django_version < (1, 10):
+            return None # Deferred fields are only supported from Django 1.10.
+
+        source = result._d_
+        values = dict((model_field.attname, model_field.to_python(source[name]))
+                      for name, model_field in self.source_fields if name in source)
+        if not values:
+            return None
+
+        pk_field = self.model._meta.pk
+        if pk_field.attname not in values:
+            if pk_field.name != self.id_field:
+                return None
+            values[pk_field.attname] = pk_field.to_python(result.meta.id)
+
+        # Model.from_db expects the values in the order of the concrete fields.
+        field_names = [field.attname for field in self.model._meta.concrete_fields if field.attname in values]
+        db = settings.BUNGIESEARCH.get('DB_ALIAS_READ') or router.db_for_read(self.model)
+        return self.model.from_db(db, field_names, [values[attname] for attname in field_names])
+
     def get_mapping(self, meta_fields=True):
         '''
         Returns the mapping for the index as a dictionary.
@@ -112,7 +163,7 @@ class ModelIndex(object):
         if not obj:
             try:
                 # We're using `filter` followed by `values` in order to only fetch the required fields.
-                obj = self.model.objects.filter(pk=obj_pk).values(*self.fields_to_fetch)[0]
+                obj = self.model._default_manager.filter(pk=obj_pk).values(*self.fields_to_fetch)[0]
             except Exception as e:
                 raise ValueError('Could not find object of primary key = {} in model {} (model index class {}). (Original exception: {}.)'.format(obj_pk, self.model, self.__class__.__name__, e))
 
@@ -128,6 +179,26 @@ class ModelIndex(object):
 
         return serialized_object
 
+    def _get_source_fields(self):
+        '''
+        Returns a tuple of the list of (index field name, model field) tuples of the model fields whose value is stored as is
+        in the index, and of the list of attribute names of the model fields stored by string fields.
+        String fields are not hydrated since their HTML tags are stripped, so that saving a hydrated instance cannot write the
+        stripped text to the database. They are fetched from the database instead, for all the hydrated instances at once.
+        '''
+        model_fields = dict((field.name, field) for field in self.model._meta.concrete_fields)
+        source_fields, string_fields = [], []
+        for name, field in iteritems(self.fields):
+            if name == '_id' or field.eval_func or field.template_name or hasattr(self, 'prepare_{}'.format(name)) or \
+               field.model_attr not in model_fields:
+                continue
+            if isinstance(field, StringField):
+                if model_fields[field.model_attr].attname not in string_fields:
+                    string_fields.append(model_fields[field.model_attr].attname)
+            else:
+                source_fields.append((name, model_fields[field.model_attr]))
+        return source_fields, string_fields
+
     def _get_fields(self, fields, excludes, hotfixes):
         '''
         Given any explicit fields to include and fields to exclude, add
@@ -0,0 +1,74 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from ...logger import logger
+from ...utils import drain_index_queue, index_queue_lag
+
+
+class Command(BaseCommand):
+    help = 'Processes the outbox queue filled by BungieOutboxSignalProcessor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            action='store',
+            dest='batch_size',
+            default=500,
+            type=int,
+            help='Specify the number of queued items processed together.')
+        parser.add_argument(
+            '--claim-timeout',
+            action='store',
+            dest='claim_timeout',
+            default=300,
+            type=int,
+            help='Specify the number of seconds after which items claimed by a consumer which did not process them may be claimed again.')
+        parser.add_argument(
+            '--forever',
+            action='store_true',
+            dest='forever',
+            default=False,
+            help='Keep polling the queue instead of exiting once it is empty.')
+        parser.add_argument(
+            '--sleep',
+            action='store',
+            dest='sleep',
+            default=1.0,
+            type=float,
+            help='Specify the number of seconds to wait between polls when running with --forever.')
+        parser.add_argument(
+            '--lag',
+            action='store_true',
+            dest='lag',
+            default=False,
+            help='Only report the queue length and the age of its oldest item.')
+
+    def report_lag(self):
+        count, lag = index_queue_lag()
+        if lag is None:
+            self.stdout.write('Index queue is empty.')
+        else:
+            self.stdout.write('Index queue has {} items, the oldest was queued {:.1f} seconds ago.'.format(count, lag.total_seconds()))
+
+    def handle(self, *args, **options):
+        if options['lag']:
+            self.report_lag()
+            return
+
+        while True:
+            try:
+                processed = drain_index_queue(batch_size=options['batch_size'], claim_timeout=options['claim_timeout'])
+            except Exception:
+                if not options['forever']:
+                    raise
+                # The failed batch is retried once its claim times out, while the rest of the queue keeps being processed.
+                logger.exception('Could not process a batch of queued index operations.')
+            else:
+                if processed:
+                    logger.info('Processed {} queued index operations.'.format(processed))
+            if not options['forever']:
+                break
+            sleep(options['sleep'])
+
+        self.report_lag()
@@ -5,6 +5,7 @@ from django.conf import settings
 from six import iteritems
 
 from ... import Bungiesearch
+from ...cache import invalidate_results
 from ...logger import logger
 from ...utils import update_index
 
@@ -98,6 +99,19 @@ class Command(BaseCommand):
             default=None,
             type=int,
             help='Specify the timeout in seconds for each operation.')
+        parser.add_argument(
+            '--database',
+            action='store',
+            dest='database',
+            default=None,
+            type=str,
+            help='Specify the database alias to read the objects to index from. Defaults to BUNGIESEARCH.DB_ALIAS_READ of settings, if set.')
+        parser.add_argument(
+            '--compress',
+            action='store_true',
+            dest='compress',
+            default=False,
+            help='Gzip the bulk requests sent when updating the index.')
 
     def handle(self, *args, **options):
         src = Bungiesearch(timeout=options.get('timeout'))
@@ -119,6 +133,7 @@ class Command(BaseCommand):
                 for index in indices:
                     logger.warning('Deleting elastic search index {}.'.format(index))
                     es.indices.delete(index=index, ignore=404)
+                invalidate_results(indices)
 
             else:
                 index_to_doctypes = defaultdict(list)
@@ -197,10 +212,14 @@ class Command(BaseCommand):
                 model_names = [model for index in indices for model in src.get_models(index)]
 
             logger.info('Updating models {} on indices {}.'.format(model_names, indices))
+            database = options.get('database') or settings.BUNGIESEARCH.get('DB_ALIAS_READ')
 
             # Update index.
             for model_name in model_names:
                 if src.get_model_index(model_name).indexing_query is not None:
-                    update_index(src.get_model_index(model_name).indexing_query, model_name, bulk_size=options['bulk_size'], num_docs=options['num_docs'], start_date=options['start_date'], end_date=options['end_date'])
+                    model_items = src.get_model_index(model_name).indexing_query
                 else:
-                    update_index(src.get_model_index(model_name).get_model().objects.all(), model_name, bulk_size=options['bulk_size'], num_docs=options['num_docs'], start_date=options['start_date'], end_date=options['end_date'])
+                    model_items = src.get_model_index(model_name).get_model()._default_manager.all()
+                if database:
+                    model_items = model_items.using(database)
+                update_index(model_items, model_name, bulk_size=options['bulk_size'], num_docs=options['num_docs'], start_date=options['start_date'], end_date=options['end_date'], compress=options['compress'])
@@ -1,15 +1,81 @@
 from django.conf import settings as dj_settings
-from django.db.models import Manager
+from django.db.models import Manager, QuerySet, signals
 
+from .cache import get_instance_cache, invalidate_instance, invalidate_instances
 from .logger import logger
 
 
+class BungiesearchQuerySet(QuerySet):
+    '''
+    A Django queryset which keeps the index up to date when using bulk operations, which do not send per instance signals.
+    Indexing only happens if signals are enabled in the settings.
+    '''
+    signal_processor = None # Set by the BungiesearchManager building the queryset.
+
+    def _clone(self, *args, **kwargs):
+        clone = super(BungiesearchQuerySet, self)._clone(*args, **kwargs)
+        clone.signal_processor = self.signal_processor
+        return clone
+
+    def _get_signal_processor(self):
+        if self.signal_processor is not None:
+            return self.signal_processor
+        # E.g. querysets of related managers, which are built from the class of the default manager.
+        return getattr(self.model._default_manager, 'signal_processor', None)
+
+    def update(self, **kwargs):
+        signal_processor = self._get_signal_processor()
+        if signal_processor is None and get_instance_cache() is None:
+            return super(BungiesearchQuerySet, self).update(**kwargs)
+
+        # Primary keys must be fetched prior to updating, since the update may change which rows match this queryset.
+        pks = list(self.values_list('pk', flat=True))
+        rows = super(BungiesearchQuerySet, self).update(**kwargs)
+        if pks:
+            invalidate_instances(self.model, pks)
+            if signal_processor is not None:
+                signal_processor.index_pks(self.model, pks)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super(BungiesearchQuerySet, self).bulk_create(objs, *args, **kwargs)
+        signal_processor = self._get_signal_processor()
+        if signal_processor is None:
+            return objs
+
+        indexable = [obj for obj in objs if obj.pk is not None]
+        if len(indexable) != len(objs):
+            logger.warning('{} of {} objects created in bulk for model {} did not get a primary key from the database backend and will not be indexed.'.format(len(objs) - len(indexable), len(objs), self.model.__name__))
+        if indexable:
+            signal_processor.index_pks(self.model, [obj.pk for obj in indexable])
+        return objs
+
+    def delete(self):
+        if self._get_signal_processor() is None:
+            return super(BungiesearchQuerySet, self).delete()
+
+        # Deleting sends a pre_delete signal per instance: let's collect them into a single bulk delete, which ignores
+        # the documents of objects which were never indexed (e.g. excluded by the indexing filter).
+        from . import Bungiesearch
+        with Bungiesearch.batch():
+            return super(BungiesearchQuerySet, self).delete()
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class BungiesearchManager(Manager):
     model = None
+    signal_processor = None
+    _queryset_class = BungiesearchQuerySet # Replaced by the queryset provided to `from_queryset`.
 
     '''
     A Django manager for integrated search into models.
     '''
+    def get_queryset(self):
+        queryset = super(BungiesearchManager, self).get_queryset()
+        queryset.signal_processor = self.signal_processor
+        return queryset
+
     @property
     def search(self):
         from bungiesearch import Bungiesearch
@@ -17,16 +83,21 @@ class BungiesearchManager(Manager):
 
     def search_index(self, index):
         from bungiesearch import Bungiesearch
-        if index not in Bungiesearch.get_index(self.model, via_class=True):
+        # Only this index is loaded, unlike `search` which must find all the indices of the model.
+        try:
+            indexed = self.model.__name__ in Bungiesearch.get_models(index)
+        except KeyError:
+            indexed = False
+        if not indexed:
             logger.warning('Model/doctype {} is not present on index {}: search may return no results.'.format(self.model.__name__, index))
-        return Bungiesearch().index(index).doc_type(self.model.__name__)
+        return Bungiesearch(index=index).doc_type(self.model.__name__)
 
     def custom_search(self, index, doc_type):
         '''
         Performs a search on a custom elasticsearch index and mapping. Will not attempt to map result objects.
         '''
         from bungiesearch import Bungiesearch
-        return Bungiesearch(raw_results=True).index(index).doc_type(doc_type)
+        return Bungiesearch(raw_results=True, index=index).doc_type(doc_type)
 
     def contribute_to_class(self, cls, name):
         '''
@@ -35,12 +106,14 @@ class BungiesearchManager(Manager):
         '''
         super(BungiesearchManager, self).contribute_to_class(cls, name)
 
-        from . import Bungiesearch
-        from .signals import get_signal_processor
-        settings = Bungiesearch.BUNGIE
+        settings = dj_settings.BUNGIESEARCH
         if 'SIGNALS' in settings:
+            from .signals import get_signal_processor
             self.signal_processor = get_signal_processor()
             self.signal_processor.setup(self.model)
+        if 'INSTANCE_CACHE' in settings:
+            signals.post_save.connect(invalidate_instance, sender=self.model)
+            signals.pre_delete.connect(invalidate_instance, sender=self.model)
 
     def __getattr__(self, alias):
         '''
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexQueueItem',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('model_name', models.CharField(max_length=255)),
+                ('object_pk', models.CharField(max_length=255)),
+                ('document_id', models.CharField(max_length=255, null=True, blank=True)),
+                ('action', models.CharField(default='index', max_length=6, choices=[('index', 'index'), ('delete', 'delete')])),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('claimed_by', models.CharField(db_index=True, max_length=64, null=True, blank=True)),
+                ('claimed_at', models.DateTimeField(null=True, blank=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import models
+from six import python_2_unicode_compatible
+
+
+@python_2_unicode_compatible
+class IndexQueueItem(models.Model):
+    '''
+    Outbox row recording that a managed object must be indexed or deleted from elasticsearch.
+    Written by `BungieOutboxSignalProcessor` and drained by the `process_index_queue` command.
+    '''
+    ACTIONS = (('index', 'index'), ('delete', 'delete'))
+
+    model_name = models.CharField(max_length=255)
+    object_pk = models.CharField(max_length=255)
+    # Elasticsearch document id of deleted objects, which can no longer be computed from the database once they are deleted.
+    document_id = models.CharField(max_length=255, null=True, blank=True)
+    action = models.CharField(max_length=6, choices=ACTIONS, default='index')
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    claimed_by = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'bungiesearch'
+
+    def __str__(self):
+        return '{0.action} {0.model_name}.{0.object_pk}'.format(self)
@@ -0,0 +1,171 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from weakref import WeakKeyDictionary
+
+from django.core.paginator import Paginator
+from elasticsearch_dsl import Q
+from six import iteritems, string_types
+
+# Sort field used to break ties between documents with the same sort values. Elasticsearch 2.x does not index `_id`,
+# so the tie is broken on `_uid`, i.e. the doc type and `_id` of the document.
+TIE_BREAKER = '_uid'
+
+_search_after_support = WeakKeyDictionary()
+
+
+def encode_cursor(sort_values):
+    '''
+    Returns an opaque cursor from the sort values of the last document of a page.
+    '''
+    return urlsafe_b64encode(json.dumps(sort_values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    '''
+    Returns the sort values of a cursor returned by `encode_cursor`.
+    :raise ValueError: if the cursor is invalid.
+    '''
+    try:
+        sort_values = json.loads(urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError('Invalid pagination cursor: {}.'.format(cursor))
+    if not isinstance(sort_values, list):
+        raise ValueError('Invalid pagination cursor: {}.'.format(cursor))
+    return sort_values
+
+
+def supports_search_after(es):
+    '''
+    Returns True if the elasticsearch cluster supports `search_after` (from version 5.0). The version is only requested once per client.
+    '''
+    if es not in _search_after_support:
+        _search_after_support[es] = int(es.info()['version']['number'].split('.')[0]) >= 5
+    return _search_after_support[es]
+
+
+def get_sort_keys(search):
+    '''
+    Returns the sort of the search as a list of (field, order) tuples, ending with the tie breaker.
+    '''
+    keys = []
+    for sort in search._sort:
+        if isinstance(sort, string_types):
+            if sort.startswith('-'):
+                field, order = sort[1:], 'desc'
+            else:
+                field, order = sort, 'desc' if sort == '_score' else 'asc'
+        else:
+            field, options = next(iteritems(sort))
+            default_order = 'desc' if field == '_score' else 'asc'
+            order = options if isinstance(options, string_types) else options.get('order', default_order)
+        keys.append((field, order))
+    if TIE_BREAKER not in [field for field, _ in keys]:
+        keys.append((TIE_BREAKER, 'asc'))
+    return keys
+
+
+def keyset_filter(sort_keys, sort_values):
+    '''
+    Returns a query matching the documents sorted after the provided sort values, emulating `search_after` with range filters.
+    Documents missing a sort field are not matched.
+    '''
+    clauses = []
+    for pos, (field, order) in enumerate(sort_keys):
+        if field == '_score':
+            raise ValueError('Cursor pagination sorted by _score requires search_after, which is only supported from elasticsearch 5.0.')
+        must = [Q('term', **{prev_field: prev_value}) for (prev_field, _), prev_value in zip(sort_keys[:pos], sort_values[:pos])]
+        must.append(Q('range', **{field: {'gt' if order == 'asc' else 'lt': sort_values[pos]}}))
+        clauses.append(Q('bool', must=must))
+    return Q('bool', should=clauses, minimum_should_match=1)
+
+
+class CursorPage(object):
+    '''
+    A page of results returned by cursor pagination. Iterate over it to get the results, and use `next_cursor` to get the next page.
+    '''
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, key):
+        return self.object_list[key]
+
+
+def get_cursor_page(search, cursor=None, size=20):
+    '''
+    Returns the CursorPage of `size` results of the search following the cursor, or the first page if the cursor is None.
+    Uses `search_after` if supported by the cluster, and range filters on the sort fields otherwise.
+    :raise ValueError: if the cursor is invalid, or if the search is sorted by _score and the cluster does not support `search_after`.
+    '''
+    sort_keys = get_sort_keys(search)
+    search_after = supports_search_after(search.get_es_instance())
+    if not search_after and '_score' in [field for field, _ in sort_keys]:
+        # Checked before returning the first page, whose cursor could not be used.
+        raise ValueError('Cursor pagination sorted by _score requires search_after, which is only supported from elasticsearch 5.0.')
+
+    page_search = search.sort(*[{field: {'order': order}} for field, order in sort_keys])
+    if cursor is not None:
+        sort_values = decode_cursor(cursor)
+        if len(sort_values) != len(sort_keys):
+            raise ValueError('Pagination cursor {} does not match the sort of this search.'.format(cursor))
+        if search_after:
+            page_search = page_search.extra(search_after=sort_values)
+        else:
+            page_search = page_search.filter(keyset_filter(sort_keys, sort_values))
+
+    # Fetching one more result tells whether there is a next page.
+    page_search = page_search.extra(from_=0, size=size + 1)
+    results = page_search.execute()
+    next_cursor = None
+    if len(results) > size:
+        next_cursor = encode_cursor(list(page_search.raw_results.hits[size - 1].meta.sort))
+    return CursorPage(results[:size], next_cursor)
+
+
+class SearchPaginator(Paginator):
+    '''
+    Django paginator of a Bungiesearch search. The number of hits is taken from the response of the first requested page,
+    instead of sending a separate count request, and is then reused.
+    '''
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True):
+        super(SearchPaginator, self).__init__(object_list, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page)
+        self._hits_count = None
+
+    @property
+    def count(self):
+        if self._hits_count is None:
+            self._hits_count = self.object_list.count()
+        return self._hits_count
+
+    def page(self, number):
+        prefetched = None
+        if self._hits_count is None:
+            try:
+                bottom = (int(number) - 1) * self.per_page
+            except (TypeError, ValueError):
+                bottom = None
+            if bottom is not None and bottom >= 0:
+                page_search = self.object_list.extra(from_=bottom, size=self.per_page + self.orphans)
+                prefetched = (bottom, page_search.execute())
+                self._hits_count = page_search.raw_results.hits.total
+
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        if prefetched is not None and prefetched[0] == bottom:
+            object_list = prefetched[1][:top - bottom]
+        else:
+            object_list = self.object_list[bottom:top]
+        return self._get_page(object_list, number, self)
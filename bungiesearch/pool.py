@@ -0,0 +1,39 @@
+import os
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_pool_lock = Lock()
+_pool = {}
+
+
+def get_mapping_pool():
+    '''
+    Returns the thread pool used to run the database queries of a mapping concurrently, or None if
+    BUNGIESEARCH['MAPPING_THREADS'] is not set. The pool is created lazily, and again after a fork since threads do not survive it.
+    '''
+    threads = settings.BUNGIESEARCH.get('MAPPING_THREADS')
+    if not threads:
+        return None
+    pid = os.getpid()
+    if _pool.get('pid') != pid:
+        with _pool_lock:
+            if _pool.get('pid') != pid:
+                _pool['pool'] = ThreadPool(threads)
+                _pool['pid'] = pid
+    return _pool['pool']
+
+
+def fetch_in_bulk(job):
+    '''
+    Fetches the instances of a mapping job, a tuple of a queryset and a list of primary keys, from a pool thread.
+    Each pool thread uses its own database connections, which are closed according to CONN_MAX_AGE, as done at the end of a request.
+    '''
+    queryset, pks = job
+    close_old_connections()
+    try:
+        return queryset.in_bulk(pks)
+    finally:
+        close_old_connections()
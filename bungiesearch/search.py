@@ -0,0 +1,873 @@
+import json
+from collections import OrderedDict, defaultdict
+from copy import copy
+from importlib import import_module
+from threading import RLock
+
+from django.conf import settings
+from django.db import connections, router
+from elasticsearch.client import Elasticsearch
+from elasticsearch.exceptions import TransportError
+from elasticsearch.helpers import ScanError
+from elasticsearch_dsl.query import MatchAll
+from elasticsearch_dsl.result import Response, Result
+from elasticsearch_dsl.search import Search
+from six import iteritems, itervalues, string_types, text_type
+
+from .aliases import SearchAlias, combine_bodies
+from .cache import (cache_instances, get_cached_instances, get_count_cache_timeout,
+                    get_result_cache, get_result_cache_timeout, result_cache_key)
+from .connection import ConnectionRegistry, get_connection_settings
+from .indices import ModelIndex
+from .logger import logger
+from .pagination import get_cursor_page
+from .pool import fetch_in_bulk, get_mapping_pool
+from .serializers import get_serializer
+from .singleflight import SingleFlight
+
+_HIT_META_FIELDS = ('_id', '_score', '_type', '_index')
+
+
+def _hit_value_getter(field):
+    '''
+    Returns a function returning the value of a field of a hit (as a dictionary from the elasticsearch response).
+    '''
+    if field in _HIT_META_FIELDS:
+        return lambda hit: hit.get(field)
+    path = field.split('.')
+
+    def getter(hit):
+        value = hit.get('_source')
+        for name in path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(name)
+        return value
+    return getter
+
+
+class Bungiesearch(Search):
+    '''
+    This object is used to read Django settings and initialize the elasticsearch connection.
+    '''
+    DEFAULT_TIMEOUT = 5
+    BUNGIE = settings.BUNGIESEARCH
+
+    # The following code loads each model index_name module (as defined in the settings) and stores
+    # index_name name to model index_name, and index_name name to model. Settings shouldn't change between
+    # subsequent calls to Search(), which is why this is static code.
+
+    _connections = ConnectionRegistry()
+    _settings_key = None # Registry key of the connection settings.
+    # Let's go through the settings in order to map each defined Model/ModelIndex to the elasticsearch index_name.
+    _model_to_index, _model_name_to_index, _model_name_to_model_idx = defaultdict(list), defaultdict(list), defaultdict(list)
+    _index_to_model, _idx_name_to_mdl_to_mdlidx = defaultdict(list), defaultdict(dict)
+    _model_name_to_default_index, _alias_hooks = {}, {}
+    _model_dependencies = defaultdict(list)
+    _msearch_params = ('search_type', 'preference', 'routing', 'request_cache')
+    _single_flight = SingleFlight()
+    _managed_models = []
+    __loaded_indices__ = False # True once all the indices are loaded.
+    _settings_lock = RLock()
+    _loaded_index_names, _importing_index_names = set(), set()
+    _loaded_aliases = False
+
+    @classmethod
+    def __load_settings__(cls, index_names=None):
+        '''
+        Loads the ModelIndex classes of the provided indices (all the indices defined in the settings if None) and the search aliases,
+        unless they are already loaded. Loading is thread safe, and only imports the index modules which are not loaded yet.
+        :param index_names: index name or list of index names.
+        '''
+        if cls.__loaded_indices__:
+            return
+        if index_names is not None:
+            if isinstance(index_names, string_types):
+                index_names = [index_names]
+            index_names = [index_name for index_name in index_names if index_name in cls.BUNGIE['INDICES']]
+            if cls._loaded_aliases and all(index_name in cls._loaded_index_names for index_name in index_names):
+                return
+
+        with cls._settings_lock:
+            if cls.__loaded_indices__:
+                return
+            for index_name, module_str in iteritems(cls.BUNGIE['INDICES']):
+                # An index being imported by this thread is skipped, in case its module searches when imported.
+                if (index_names is None or index_name in index_names) and index_name not in cls._loaded_index_names and \
+                   index_name not in cls._importing_index_names:
+                    cls._importing_index_names.add(index_name)
+                    try:
+                        cls._load_index(index_name, module_str)
+                        cls._loaded_index_names.add(index_name)
+                    finally:
+                        cls._importing_index_names.discard(index_name)
+
+            if not cls._loaded_aliases:
+                cls._loaded_aliases = True
+                cls._load_aliases()
+            cls.__loaded_indices__ = all(index_name in cls._loaded_index_names for index_name in cls.BUNGIE['INDICES'])
+
+    @classmethod
+    def _load_index(cls, index_name, module_str):
+        '''
+        Imports the module of an index and registers its ModelIndex classes. Nothing is registered if the module cannot be
+        imported or if one of its ModelIndex classes is invalid, so that the index can be loaded again once fixed.
+        '''
+        index_module = import_module(module_str)
+        index_instances, default_indices = [], {}
+        for index_obj in itervalues(index_module.__dict__):
+            try:
+                if not issubclass(index_obj, ModelIndex) or index_obj == ModelIndex:
+                    continue
+            except TypeError:
+                continue # Oops, just attempted to get subclasses of a non-class.
+            index_instance = index_obj()
+            model_name = index_instance.get_model().__name__
+            if index_instance.is_default:
+                default_index = cls._model_name_to_default_index.get(model_name) or default_indices.get(model_name)
+                if default_index is not None:
+                    raise AttributeError('ModelIndex {} on index {} is marked as default, but {} was already set as default.'.format(index_instance, index_name, default_index))
+                default_indices[model_name] = index_instance
+            index_instances.append(index_instance)
+
+        new_dependencies = False
+        for index_instance in index_instances:
+            assoc_model = index_instance.get_model()
+            cls._index_to_model[index_name].append(assoc_model)
+            cls._model_name_to_model_idx[assoc_model.__name__].append(index_instance)
+            cls._idx_name_to_mdl_to_mdlidx[index_name][assoc_model.__name__] = index_instance
+            for related_model, lookup in iteritems(index_instance.depends_on):
+                if (assoc_model, lookup) not in cls._model_dependencies[related_model]:
+                    cls._model_dependencies[related_model].append((assoc_model, lookup))
+                    new_dependencies = True
+        cls._model_name_to_default_index.update(default_indices)
+
+        # Create reverse maps in order to have O(1) access.
+        for model in cls._index_to_model[index_name]:
+            cls._model_to_index[model].append(index_name)
+            cls._model_name_to_index[model.__name__].append(index_name)
+
+        if new_dependencies and 'SIGNALS' in cls.BUNGIE:
+            from .signals import connect_dependency_signals
+            connect_dependency_signals()
+
+    @classmethod
+    def _load_aliases(cls):
+        for alias_prefix, module_str in iteritems(cls.BUNGIE.get('ALIASES', {})):
+            if alias_prefix is None:
+                alias_prefix = 'bungie'
+            if alias_prefix != '':
+                alias_prefix += '_'
+            alias_module = import_module(module_str)
+            for alias_obj in itervalues(alias_module.__dict__):
+                try:
+                    if issubclass(alias_obj, SearchAlias) and alias_obj != SearchAlias:
+                        alias_instance = alias_obj()
+                        cls._alias_hooks[alias_prefix + alias_instance.alias_name] = alias_instance
+                except TypeError:
+                    pass # Oops, just attempted to get subclasses of a non-class.
+
+    @classmethod
+    def _build_key(cls, urls, timeout, **settings):
+        # Order the settings by key, and turn them into a string with repr
+        # if some values are not hashable. There are a lot of edge cases
+        # here, but the worst that happens is that the key is different
+        # and so you get a new Elasticsearch.
+        settings = tuple(sorted(settings.items(), key=lambda item: item[0]))
+        try:
+            hash(settings)
+        except TypeError:
+            settings = repr(settings)
+        # elasticsearch allows URLs to be a string, so we make sure to
+        # account for that when converting whatever it is into a tuple.
+        if isinstance(urls, string_types):
+            urls = (urls,)
+        else:
+            urls = tuple(urls)
+        # Generate a tuple of all the bits and return that as the key
+        # because that's hashable.
+        key = (urls, timeout, settings)
+        return key
+
+    @classmethod
+    def get_connection(cls, urls=None, timeout=None, force_new=False, **es_settings):
+        '''
+        Returns the elasticsearch client of the provided connection settings, which is shared by all the searches (and threads)
+        of the process using the same settings. A forked process builds its own clients.
+        :param urls: A list of URLs, or a single string of URL (without leading `http://`), or None to read from settings.
+        :param timeout: Timeout used in the connection, or None to read from settings.
+        :param force_new: Set to `True` to build and register a new client.
+        :param es_settings: settings of the elasticsearch client, or none to read them from BUNGIESEARCH['ES_SETTINGS'].
+        '''
+        serializer = get_serializer()
+        use_settings = not urls and not timeout and not es_settings
+
+        urls = urls or cls.BUNGIE['URLS']
+        timeout = timeout or cls.BUNGIE.get('TIMEOUT', cls.DEFAULT_TIMEOUT)
+        # If there aren't any provided elasticsearch settings, let's see if it's defined in the settings.
+        es_settings = es_settings or cls.BUNGIE.get('ES_SETTINGS', {})
+        if use_settings:
+            # Clients using the connection settings are the most common, so the key of these settings is only computed once.
+            if cls._settings_key is None:
+                cls._settings_key = cls._build_key(urls, timeout, **es_settings)
+            cache_key = (cls._settings_key, serializer)
+        else:
+            cache_key = (cls._build_key(urls, timeout, **es_settings), serializer)
+
+        def build_client():
+            client_settings = es_settings
+            if serializer is not None and 'serializer' not in client_settings:
+                client_settings = dict(client_settings, serializer=serializer)
+            return Elasticsearch(urls, timeout=timeout, **get_connection_settings(client_settings))
+
+        return cls._connections.get(cache_key, build_client, force_new)
+
+    @classmethod
+    def get_index(cls, model, via_class=False):
+        '''
+        Returns the index name (as a string) for the given model as a class or a string.
+        All the indices are loaded, since any of them may define a ModelIndex of the model.
+        :param model: model name or model class if via_class set to True.
+        :param via_class: set to True if parameter model is a class.
+        :raise KeyError: If the provided model does not have any index associated.
+        '''
+        cls.__load_settings__()
+        try:
+            return cls._model_to_index[model] if via_class else cls._model_name_to_index[model]
+        except KeyError:
+            raise KeyError('Could not find any index defined for model {}. Is the model in one of the model index modules of BUNGIESEARCH["INDICES"]?'.format(model))
+
+    @classmethod
+    def get_model_index(cls, model, default=True):
+        '''
+        Returns the default model index for the given model, or the list of indices if default is False.
+        All the indices are loaded, since any of them may define a ModelIndex of the model.
+        :param model: model name as a string.
+        :raise KeyError: If the provided model does not have any index associated.
+        '''
+        cls.__load_settings__()
+        try:
+            if default:
+                return cls._model_name_to_default_index[model]
+            return cls._model_name_to_model_idx[model]
+        except KeyError:
+            raise KeyError('Could not find any model index defined for model {}.'.format(model))
+
+    @classmethod
+    def get_dependents(cls, model, pks):
+        '''
+        Returns a list of (model, queryset) tuples of the indexed objects whose documents depend on the provided objects,
+        as declared in `depends_on` of the ModelIndex Meta.
+        :param model: model class of the objects which changed.
+        :param pks: primary keys of the objects which changed.
+        '''
+        cls.__load_settings__()
+        # Reading from the primary database, since replicas may lag behind the change.
+        return [(dep_model, dep_model._default_manager.using(router.db_for_write(dep_model)).filter(**{'{}__in'.format(lookup): pks}).distinct())
+                for dep_model, lookup in cls._model_dependencies.get(model, [])]
+
+    @classmethod
+    def get_indices(cls):
+        '''
+        Returns the list of indices defined in the settings.
+        '''
+        cls.__load_settings__()
+        return cls._idx_name_to_mdl_to_mdlidx.keys()
+
+    @classmethod
+    def get_models(cls, index, as_class=False):
+        '''
+        Returns the list of models defined for this index.
+        :param index: index name.
+        :param as_class: set to True to return the model as a model object instead of as a string.
+        '''
+        cls.__load_settings__(index)
+        if index not in cls._idx_name_to_mdl_to_mdlidx: # Not indexing the defaultdicts, which would register the index.
+            raise KeyError('Could not find any index named {}. Is this index defined in BUNGIESEARCH["INDICES"]?'.format(index))
+        return cls._index_to_model[index] if as_class else cls._idx_name_to_mdl_to_mdlidx[index].keys()
+
+    @classmethod
+    def get_model_indices(cls, index):
+        '''
+        Returns the list of model indices (i.e. ModelIndex objects) defined for this index.
+        :param index: index name.
+        '''
+        cls.__load_settings__(index)
+        if index not in cls._idx_name_to_mdl_to_mdlidx: # Not indexing the defaultdict, which would register the index.
+            raise KeyError('Could not find any index named {}. Is this index defined in BUNGIESEARCH["INDICES"]?'.format(index))
+        return cls._idx_name_to_mdl_to_mdlidx[index].values()
+
+    @classmethod
+    def batch(cls, bulk_size=100, refresh=True):
+        '''
+        Returns a context manager (also usable as a decorator) which suspends signal based indexing on the current thread.
+        Objects saved or deleted within it are reindexed in bulk on exit, followed by a single refresh.
+        :param bulk_size: number of objects per bulk request when reindexing.
+        :param refresh: set to False to skip refreshing the touched indices on exit.
+        '''
+        from .signals import BatchIndexing
+        return BatchIndexing(bulk_size=bulk_size, refresh=refresh)
+
+    @classmethod
+    def map_raw_results(cls, raw_results, instance=None):
+        '''
+        Maps raw results to database model objects.
+        :param raw_results: list raw results as returned from elasticsearch-dsl-py.
+        :param instance: Bungiesearch instance if you want to make use of `.only()` or `optmize_queries` as defined in the ModelIndex.
+        :return: list of mapped results in the *same* order as returned by elasticsearch.
+        '''
+        # Let's iterate over the results and group them by (index name, model name), keyed by their elasticsearch id.
+        model_results = defaultdict(dict)
+        # Initializing the list to the number of returned results. This allows us to restore each item in its position.
+        if hasattr(raw_results, 'hits'):
+            results = [None] * len(raw_results.hits)
+        else:
+            results = [None] * len(raw_results)
+        model_name_to_index = Bungiesearch._model_name_to_index
+        db_alias_read = settings.BUNGIESEARCH.get('DB_ALIAS_READ')
+        for pos, result in enumerate(raw_results):
+            meta = result.meta
+            if meta.index not in model_name_to_index.get(meta.doc_type, ()):
+                logger.warning('Returned object of type {} ({}) is not defined in the settings, or is not associated to the same index as in the settings.'.format(meta.doc_type, result))
+                results[pos] = result
+            else:
+                model_results[(meta.index, meta.doc_type)][meta.id] = (pos, result)
+
+        # Now that we have model ids per model name, let's fetch everything at once.
+        jobs = []
+        for (index_name, model_name), hits in iteritems(model_results):
+            model_idx = Bungiesearch._idx_name_to_mdl_to_mdlidx[index_name][model_name]
+            model_obj = model_idx.get_model()
+            # Keying the hits by primary key value, as returned by the database.
+            to_python = model_obj._meta.pk.to_python
+            hits = dict((to_python(item_id), hit) for item_id, hit in iteritems(hits))
+
+            from_source = model_idx.hydrate_from_source
+            if instance is not None and instance._from_source is not None:
+                from_source = instance._from_source
+            if from_source:
+                # Building instances from the stored documents, and only fetching those which could not be built.
+                hydrated = {}
+                for pk, (pos, result) in list(iteritems(hits)):
+                    item = model_idx.instance_from_source(result)
+                    if item is not None:
+                        item._searchmeta = result.meta
+                        results[pos] = item
+                        hydrated[pk] = item
+                        del hits[pk]
+                if hydrated and model_idx.source_string_fields:
+                    # Stored strings are stripped of their HTML tags, hence are fetched at once instead of per instance and field.
+                    string_fields = model_idx.source_string_fields
+                    queryset = model_obj._default_manager.using(db_alias_read) if db_alias_read else model_obj._default_manager.all()
+                    for row in queryset.filter(pk__in=list(hydrated)).values_list('pk', *string_fields):
+                        hydrated[row[0]].__dict__.update(zip(string_fields, row[1:]))
+
+            # Instances in the instance cache (if enabled) are not fetched from the database.
+            if hits:
+                for pk, item in iteritems(get_cached_instances(model_obj, list(hits))):
+                    pos, result = hits.pop(pk)
+                    item._searchmeta = result.meta
+                    results[pos] = item
+            if not hits:
+                continue
+
+            queryset = model_obj._default_manager.all()
+            if db_alias_read:
+                queryset = queryset.using(db_alias_read)
+            desired_fields = None
+            if instance is not None:
+                if instance._only == '__model' or model_idx.optimize_queries:
+                    desired_fields = model_idx.fields_to_fetch
+                elif instance._only == '__fields':
+                    desired_fields = instance._fields
+                else:
+                    desired_fields = instance._only
+
+                if desired_fields: # Prevents setting the database fetch to __fields but not having specified any field to elasticsearch.
+                    queryset = queryset.only(*model_idx.get_only_fields(desired_fields))
+
+            jobs.append((model_obj, hits, not desired_fields, queryset))
+
+        # Running the database queries concurrently if there are several and if enabled in the settings.
+        # However, queries within a transaction are not run concurrently, since other connections may not see its changes.
+        pool = get_mapping_pool() if len(jobs) > 1 else None
+        if pool is not None and not any(connections[queryset.db].in_atomic_block for _, _, _, queryset in jobs):
+            fetched = pool.map(fetch_in_bulk, [(queryset, list(hits)) for _, hits, _, queryset in jobs])
+        else:
+            fetched = [queryset.in_bulk(list(hits)) for _, hits, _, queryset in jobs]
+
+        for (model_obj, hits, cacheable, _), items in zip(jobs, fetched):
+            if cacheable:
+                cache_instances(model_obj, list(itervalues(items)))
+            # Let's reposition each item in the results and set the _searchmeta meta information.
+            for pk, item in iteritems(items):
+                pos, result = hits[pk]
+                item._searchmeta = result.meta
+                results[pos] = item
+
+        return results
+
+    @classmethod
+    def multi(cls, searches, raise_on_error=False):
+        '''
+        Executes several searches in a single multi search request, and maps their results with one database query per model
+        across all the searches (per set of mapping options, i.e. `only`, `fields` and `from_source`).
+        The results of each search are also stored in its `results` and `raw_results` attributes.
+        :param searches: list of Bungiesearch instances, which must use the same elasticsearch connection.
+        :param raise_on_error: set to True to raise the error of the first failed search instead of returning it.
+        :return: list of the results of each search, in the same order as the searches, or of a TransportError for failed searches.
+        '''
+        if not searches:
+            return []
+
+        body = []
+        for search in searches:
+            header = dict((param, value) for param, value in iteritems(search._params) if param in cls._msearch_params)
+            if search._index:
+                header['index'] = ','.join(search._index)
+            if search._doc_type:
+                header['type'] = ','.join(search._doc_type)
+            query = search.to_dict()
+            source = search._mapping_source()
+            if source is not None:
+                query['_source'] = source
+            body.extend([header, query])
+        responses = searches[0].get_es_instance().msearch(body=body)['responses']
+
+        all_results = [None] * len(searches)
+        groups = defaultdict(list)
+        for pos, (search, response) in enumerate(zip(searches, responses)):
+            if 'error' in response:
+                error = response['error']
+                all_results[pos] = TransportError(response.get('status', 'N/A'), error.get('type') if isinstance(error, dict) else error, error)
+                if raise_on_error:
+                    raise all_results[pos]
+                continue
+            search.raw_results = Response(response, callbacks=search._doc_type_map)
+            if search._values_list is not None:
+                search.results = all_results[pos] = search._hits_values(response['hits']['hits'])
+            elif search._raw_results_only:
+                search.results = all_results[pos] = search.raw_results
+            else:
+                groups[(repr(search._only), repr(search._fields), search._from_source)].append(pos)
+
+        for positions in itervalues(groups):
+            # Mapping each document once, even if it was returned by several searches.
+            unique_hits = OrderedDict()
+            for pos in positions:
+                for hit in searches[pos].raw_results:
+                    unique_hits.setdefault((hit.meta.index, hit.meta.doc_type, hit.meta.id), hit)
+            mapped = dict(zip(unique_hits, cls.map_raw_results(list(itervalues(unique_hits)), searches[positions[0]])))
+
+            for pos in positions:
+                results = []
+                for hit in searches[pos].raw_results:
+                    key = (hit.meta.index, hit.meta.doc_type, hit.meta.id)
+                    item = mapped[key]
+                    if item is unique_hits[key]:
+                        item = hit # Unmapped document.
+                    elif item is not None and unique_hits[key] is not hit:
+                        item = copy(item)
+                        item._searchmeta = hit.meta
+                    results.append(item)
+                searches[pos].results = all_results[pos] = results
+        return all_results
+
+    def __init__(self, urls=None, timeout=None, force_new=False, raw_results=False, **kwargs):
+        '''
+        Creates a new ElasticSearch DSL object. Grabs the ElasticSearch connection from the pool
+        if it has already been initialized. Otherwise, creates a new one.
+
+        If no parameters are passed, everything is determined from the Django settings.
+
+        :param urls: A list of URLs, or a single string of URL (without leading `http://`), or None to read from settings.
+        :param idx: A list of indices or a single string representing an index_name name. Is optional. Will be merged with `idx_alias`.
+        :param idx_alias: A list of index_name aliases or a single string representing an index_name alias, as defined in the settings. Will be merged with `index_name`.
+        :param timeout: Timeout used in the connection.
+        :param force_new: Set to `True` to force a new elasticsearch connection. Otherwise will aggressively use any connection with the exact same settings.
+        :param **kwargs: Additional settings to pass to the low level elasticsearch client and to elasticsearch-sal-py.search.Search.
+        '''
+
+        search_keys = ['using', 'index', 'doc_type', 'extra']
+        search_settings, es_settings = {}, {}
+        for k, v in iteritems(kwargs):
+            if k in search_keys:
+                search_settings[k] = v
+            else:
+                es_settings[k] = v
+
+        # Searches on specific indices only need those to be loaded.
+        Bungiesearch.__load_settings__(search_settings.get('index'))
+
+        if 'using' not in search_settings:
+            search_settings['using'] = Bungiesearch.get_connection(urls, timeout, force_new, **es_settings)
+
+        super(Bungiesearch, self).__init__(**search_settings)
+
+        # Creating instance attributes.
+        self._only = [] # Stores the exact fields to fetch from the database when mapping.
+        self.results = [] # Store the mapped and unmapped results.
+        self.raw_results = None # Stores the elasticsearch-dsl-py response once executed.
+        self._raw_results_only = raw_results
+        self._from_source = None # Overrides `hydrate_from_source` of the ModelIndex Meta when set.
+        self._cache_timeout = None # Overrides the result cache timeout when set.
+        self._template_body = None # Request body rendered from search templates.
+        self._values_list, self._values_flat = None, False # Fields returned instead of results, cf. `values_list`.
+
+    def _clone(self):
+        '''
+        Must clone additional fields to those cloned by elasticsearch-dsl-py.
+        '''
+        instance = super(Bungiesearch, self)._clone()
+        instance._raw_results_only = self._raw_results_only
+        instance._from_source = self._from_source
+        instance._cache_timeout = self._cache_timeout
+        instance._template_body = self._template_body
+        instance._values_list, instance._values_flat = self._values_list, self._values_flat
+        return instance
+
+    def to_dict(self, count=False, **kwargs):
+        '''
+        Returns the request body, combining the body rendered from search templates with what was set on this search.
+        '''
+        body = super(Bungiesearch, self).to_dict(count=count, **kwargs)
+        if self._template_body is None:
+            return body
+        if isinstance(self.query._proxied, MatchAll):
+            del body['query']
+        template_body = self._template_body
+        if count:
+            template_body = dict((key, value) for key, value in iteritems(template_body) if key in ('query', 'post_filter'))
+        return combine_bodies(template_body, body)
+
+    def template(self, search_template, **params):
+        '''
+        Returns a search whose request body is rendered from a SearchTemplate, which is compiled once, instead of built from
+        elasticsearch-dsl-py objects on every call. Queries and filters set on this search also apply, before or after.
+        :param search_template: `bungiesearch.aliases.SearchTemplate` instance.
+        :param params: values of the parameters of the template.
+        '''
+        s = self._clone()
+        body = search_template.render(**params)
+        s._template_body = body if s._template_body is None else combine_bodies(s._template_body, body)
+        return s
+
+    def get_es_instance(self):
+        '''
+        Returns the low level elasticsearch instance to perform low level operations.
+        '''
+        return self._using
+
+    def _mapping_source(self):
+        '''
+        Returns the `_source` to request when the results will be mapped to model instances, since mapping only uses the hits meta data:
+        False, or the stored fields of the searched models whose instances are built from the stored documents.
+        Returns None if the source must be left as is, i.e. if the source or fields were set explicitly, or if some hits may not be mapped.
+        Searches returning values (cf. `values_list`) only request the source fields of these values.
+        '''
+        if self._values_list is not None:
+            return sorted(set(field for field in self._values_list if field not in _HIT_META_FIELDS)) or False
+
+        if self._raw_results_only or self._source or self._fields is not None or '_source' in self._extra or \
+           any(param.startswith('_source') for param in self._params) or not self._doc_type or \
+           (self._template_body is not None and ('_source' in self._template_body or 'fields' in self._template_body)):
+            return None
+
+        source_fields = set()
+        for doc_type in self._doc_type:
+            if doc_type not in Bungiesearch._model_name_to_index:
+                return None
+            for index_name in Bungiesearch._model_name_to_index[doc_type]:
+                model_idx = Bungiesearch._idx_name_to_mdl_to_mdlidx[index_name][doc_type]
+                from_source = model_idx.hydrate_from_source if self._from_source is None else self._from_source
+                if from_source:
+                    source_fields.update(name for name, _ in model_idx.source_fields)
+        return sorted(source_fields) or False
+
+    def _result_cache_key(self, cache, count=False):
+        '''
+        Returns the result cache key of this search, or None if it may not be cached, i.e. if it searches indices which
+        are not defined in the settings, since their updates do not invalidate the cache.
+        :param count: set to True to get the key of the number of hits of this search instead of its response.
+        '''
+        index_names = sorted(self._index or Bungiesearch.get_indices())
+        if not all(index_name in Bungiesearch._idx_name_to_mdl_to_mdlidx for index_name in index_names):
+            return None
+        search_data = [self.to_dict(count=count), self._index, self._doc_type, self._params]
+        if count:
+            search_data.append('count')
+        return result_cache_key(cache, search_data, index_names)
+
+    def execute_raw(self):
+        source = self._mapping_source()
+        search = self if source is None else self.params(_source=source)
+
+        cache = get_result_cache() if self._cache_timeout != 0 else None
+        cache_key = search._result_cache_key(cache) if cache is not None else None
+        response = cache.get(cache_key) if cache_key is not None else None
+        if response is None:
+            response = search._send_request()
+            if cache_key is not None:
+                timeout = self._cache_timeout if self._cache_timeout is not None else get_result_cache_timeout()
+                cache.set(cache_key, response, timeout)
+        self.raw_results = Response(response, callbacks=search._doc_type_map)
+        return response
+
+    def _send_request(self):
+        '''
+        Sends the search request and returns the response. If BUNGIESEARCH['SINGLE_FLIGHT'] is set, a request identical
+        to one in flight (same body, indices, doc types and parameters) waits for and shares its response instead.
+        '''
+        es = self.get_es_instance()
+        body = self.to_dict()
+        single_flight = settings.BUNGIESEARCH.get('SINGLE_FLIGHT')
+        if single_flight is None:
+            return es.search(index=self._index, doc_type=self._doc_type, body=body, **self._params)
+
+        key = json.dumps([id(es), body, self._index, self._doc_type, self._params], sort_keys=True, default=text_type)
+        return Bungiesearch._single_flight.do(key, lambda: es.search(index=self._index, doc_type=self._doc_type, body=body, **self._params),
+                                              single_flight.get('TIMEOUT', 10))
+
+    def execute(self, return_results=True):
+        '''
+        Executes the query and attempts to create model objects from results.
+        '''
+        if self.results:
+            return self.results if return_results else None
+
+        response = self.execute_raw()
+
+        if self._values_list is not None:
+            self.results = self._hits_values(response['hits']['hits'])
+        elif self._raw_results_only:
+            self.results = self.raw_results
+        else:
+            self.map_results()
+
+        if return_results:
+            return self.results
+
+    def execute_async(self):
+        '''
+        Returns a coroutine which executes this search without blocking the event loop, as done by `execute`. Requires Python 3.5 or later.
+        '''
+        from .aio import execute_async
+        return execute_async(self)
+
+    def count_async(self):
+        '''
+        Returns a coroutine which counts the hits of this search without blocking the event loop. Requires Python 3.5 or later.
+        '''
+        from .aio import count_async
+        return count_async(self)
+
+    def map_results(self):
+        '''
+        Maps raw results and store them.
+        '''
+        self.results = Bungiesearch.map_raw_results(self.raw_results, self)
+
+    def scan(self, batch_size=500, scroll='5m', preserve_order=False):
+        '''
+        Generator over all the results of this search using the scroll API, which maps each page of results at once
+        (with one database query per model). Only one page is kept in memory, and the scroll context is cleared as soon
+        as the iteration stops, including if it is stopped early.
+        :param batch_size: number of hits per page.
+        :param scroll: how long elasticsearch keeps the scroll context alive between two pages.
+        :param preserve_order: set to True to keep the sort order of the search, which is more expensive.
+        '''
+        es = self.get_es_instance()
+        params = dict(self._params)
+        source = self._mapping_source()
+        if source is not None:
+            params['_source'] = source
+        body = self.to_dict()
+        if not preserve_order:
+            # Sorting by index order is the cheapest scroll, and replaces the scan search type removed in elasticsearch 5.0.
+            body['sort'] = ['_doc']
+
+        response = es.search(index=self._index, doc_type=self._doc_type, body=body, scroll=scroll, size=batch_size, **params)
+        scroll_id = response.get('_scroll_id')
+        try:
+            while scroll_id is not None:
+                if response['_shards']['failed']:
+                    raise ScanError(scroll_id, 'Scroll request has failed on {} shards out of {}.'.format(response['_shards']['failed'], response['_shards']['total']))
+                hits = response['hits']['hits']
+                if not hits:
+                    break
+
+                if self._values_list is not None:
+                    page = self._hits_values(hits)
+                else:
+                    page = [self._doc_type_map.get(hit['_type'], Result)(hit) for hit in hits]
+                    if not self._raw_results_only:
+                        page = Bungiesearch.map_raw_results(page, self)
+                for item in page:
+                    yield item
+
+                response = es.scroll(scroll_id, scroll=scroll)
+                scroll_id = response.get('_scroll_id')
+        finally:
+            if scroll_id is not None:
+                es.clear_scroll(body={'scroll_id': [scroll_id]}, ignore=(404, ))
+
+    def cursor_page(self, cursor=None, size=20):
+        '''
+        Returns a page of results following the provided cursor, for deep pagination without `from` offsets. The search is sorted
+        by its sort fields, with ties broken on the document id.
+        :param cursor: opaque cursor, as returned by `next_cursor` of the previous page, or None to get the first page.
+        :param size: number of results per page.
+        :return: a CursorPage, which is iterable and whose `next_cursor` is None on the last page.
+        '''
+        return get_cursor_page(self, cursor, size)
+
+    def only(self, *fields):
+        '''
+        Restricts the fields to be fetched when mapping. Set to `__model` to fetch all fields define in the ModelIndex.
+        '''
+        s = self._clone()
+        if len(fields) == 1 and fields[0] == '__model':
+            s._only = '__model'
+        else:
+            s._only = fields
+        return s
+
+    def values_list(self, *fields, **kwargs):
+        '''
+        Returns a search whose results are tuples of the provided fields of each hit, in rank order, instead of model
+        instances. Only these fields of the source are requested, and the response is not wrapped in elasticsearch-dsl-py objects.
+        :param fields: names of source fields (`.` separated for inner fields), or of the hit meta data `_id`, `_score`, `_type` and `_index`.
+        Missing fields are None.
+        :param flat: set to True to return the value of the single field instead of one-tuples.
+        '''
+        flat = kwargs.pop('flat', False)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments to values_list: {}.'.format(', '.join(kwargs)))
+        if not fields:
+            raise TypeError('values_list requires at least one field.')
+        if flat and len(fields) > 1:
+            raise TypeError('values_list with flat=True requires a single field.')
+        s = self._clone()
+        s._values_list, s._values_flat = fields, flat
+        return s
+
+    def ids(self):
+        '''
+        Returns a search whose results are the document ids of the hits, in rank order, without requesting their source.
+        '''
+        return self.values_list('_id', flat=True)
+
+    def _hits_values(self, hits):
+        '''
+        Returns the values of the hits (as dictionaries from the elasticsearch response) requested with `values_list`.
+        '''
+        getters = [_hit_value_getter(field) for field in self._values_list]
+        if self._values_flat:
+            getter = getters[0]
+            return [getter(hit) for hit in hits]
+        return [tuple(getter(hit) for getter in getters) for hit in hits]
+
+    def cache(self, timeout):
+        '''
+        Sets the number of seconds the response of this search is kept in the result cache, if enabled in the settings.
+        :param timeout: number of seconds, or 0 to neither use nor populate the result cache with this search.
+        '''
+        s = self._clone()
+        s._cache_timeout = timeout
+        return s
+
+    def from_source(self, enabled=True):
+        '''
+        Builds the mapped model instances from the documents stored in elasticsearch instead of fetching them from the database.
+        Model fields which are not stored in the index are only fetched from the database if accessed.
+        :param enabled: set to False to fetch instances from the database even if `hydrate_from_source` is set in the ModelIndex Meta.
+        '''
+        s = self._clone()
+        s._from_source = enabled
+        return s
+
+    def __iter__(self):
+        '''
+        Allows iterating on the response.
+        '''
+        self.execute()
+        return iter(self.results)
+
+    def count(self, cache=False):
+        '''
+        Returns the number of hits of this search. Once the search is executed, this is the total of its response,
+        so no other request is sent.
+        :param cache: set to True to keep the number of hits in the result cache (cf. BUNGIESEARCH['RESULT_CACHE']) for
+        its COUNT_TIMEOUT (defaults to 10 seconds), or to a number of seconds.
+        '''
+        if self.raw_results is not None:
+            return self.raw_results.hits.total
+
+        result_cache = get_result_cache() if cache is not False else None
+        cache_key = self._result_cache_key(result_cache, count=True) if result_cache is not None else None
+        if cache_key is not None:
+            count = result_cache.get(cache_key)
+            if count is not None:
+                return count
+
+        count = super(Bungiesearch, self).count()
+        if cache_key is not None:
+            result_cache.set(cache_key, count, get_count_cache_timeout() if cache is True else cache)
+        return count
+
+    def __len__(self):
+        '''
+        Returns the number of hits of this search, cf. `count`.
+        '''
+        return self.count()
+
+    def __getitem__(self, key):
+        '''
+        Overwriting the step in slice. It is used to set the results either as elasticsearch-dsl-py response object, or
+        attempt to fetch the Django model instance.
+        :warning: Getting an item will execute this search. Any search operation or field setting *must* be done prior to getting an item.
+        '''
+        if isinstance(key, slice):
+            if key.step is not None:
+                self._raw_results_only = key.step
+                if key.start is not None and key.stop is not None:
+                    single_item = key.start - key.stop == -1
+                elif key.start is None and key.stop == 1:
+                    single_item = True
+                else:
+                    single_item = False
+                key = slice(key.start, key.stop)
+            else:
+                single_item = False
+        else:
+            single_item = True
+        results = super(Bungiesearch, self).__getitem__(key).execute()
+        if single_item:
+            try:
+                return results[0]
+            except IndexError:
+                return []
+        return results
+
+    def hook_alias(self, alias, model_obj=None):
+        '''
+        Returns the alias function, if it exists and if it can be applied to this model.
+        '''
+        try:
+            search_alias = self._alias_hooks[alias]
+        except KeyError:
+            raise AttributeError('Could not find search alias named {}. Is this alias defined in BUNGIESEARCH["ALIASES"]?'.format(alias))
+        else:
+            if search_alias._applicable_models and \
+                ((model_obj and model_obj not in search_alias._applicable_models) or \
+                 not any([app_model_obj.__name__ in self._doc_type for app_model_obj in search_alias._applicable_models])):
+                    raise ValueError('Search alias {} is not applicable to model/doc_types {}.'.format(alias, model_obj if model_obj else self._doc_type))
+            search = self if search_alias.cache_timeout is None else self.cache(search_alias.cache_timeout)
+            return search_alias.prepare(search, model_obj).alias_for
+
+    def __getattr__(self, alias):
+        '''
+        Shortcut for search aliases. As explained in the docs (https://docs.python.org/2/reference/datamodel.html#object.__getattr__),
+        this is only called as a last resort in case the attribute is not found.
+        '''
+        return self.hook_alias(alias)
@@ -0,0 +1,82 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from importlib import import_module
+from threading import Lock
+from uuid import UUID
+
+from django.conf import settings
+from django.utils.functional import Promise
+from elasticsearch.exceptions import SerializationError
+from elasticsearch.serializer import JSONSerializer
+from six import string_types, text_type
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONSerializer(JSONSerializer):
+    '''
+    JSON serializer of elasticsearch requests and responses, which uses orjson if it is installed, and the C accelerated
+    standard library json module otherwise (the default elasticsearch-py serializer prefers simplejson, which is slower).
+    Dates and times are serialized in ISO 8601 format, decimals as floats, and UUIDs and lazy translation strings as strings.
+    Requests are serialized without whitespace. Note that orjson decodes integers of more than 64 bits as floats.
+    '''
+    def __init__(self):
+        self._encoder = json.JSONEncoder(default=self.default, ensure_ascii=False, separators=(',', ':'))
+
+    def default(self, data):
+        if isinstance(data, (date, datetime, time)):
+            return data.isoformat()
+        elif isinstance(data, Decimal):
+            return float(data)
+        elif isinstance(data, (UUID, Promise)):
+            return text_type(data)
+        raise TypeError('Unable to serialize {!r} (type: {}).'.format(data, type(data)))
+
+    def loads(self, s):
+        if orjson is not None:
+            try:
+                return orjson.loads(s)
+            except ValueError:
+                pass # E.g. NaN or unpaired surrogates, which the standard library supports.
+        try:
+            return json.loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data):
+        if isinstance(data, string_types):
+            return data
+
+        if orjson is not None:
+            try:
+                return orjson.dumps(data, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+            except TypeError:
+                pass # E.g. integers larger than 64 bits, which the standard library supports.
+        try:
+            return self._encoder.encode(data)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(data, e)
+
+
+_serializers_lock = Lock()
+_serializers = {}
+
+
+def get_serializer():
+    '''
+    Returns the serializer set by BUNGIESEARCH['SERIALIZER'], or None if it is not set. The setting is either a serializer
+    instance or the dotted path of a serializer class, which is instantiated once.
+    '''
+    serializer = settings.BUNGIESEARCH.get('SERIALIZER')
+    if serializer is None or not isinstance(serializer, string_types):
+        return serializer
+    if serializer not in _serializers:
+        with _serializers_lock:
+            if serializer not in _serializers:
+                module_path, class_name = serializer.rsplit('.', 1)
+                _serializers[serializer] = getattr(import_module(module_path), class_name)()
+    return _serializers[serializer]
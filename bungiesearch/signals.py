@@ -1,15 +1,25 @@
 from collections import defaultdict
+from functools import wraps
 from importlib import import_module
-from threading import Lock
+from threading import Lock, local
 
+from django.conf import settings
 from django.db.models import signals
+from six import iteritems
 
-from . import Bungiesearch
-from .utils import delete_index_item, update_index
+from .cache import invalidate_results
+from .logger import logger
+
+# Bungiesearch and the indexing functions are imported when used, since the signal processors are set up as soon as the
+# models are declared, whereas elasticsearch is only needed once the first change is indexed.
+_batch_state = local()
+_dependency_lock = Lock()
+_dependency_processors = {} # Managed model to the signal processors set up for it, the first of which reindexes its dependents.
+_dependency_senders = {} # Sender to the signal processor whose dependency receivers are connected to it.
 
 
 def get_signal_processor():
-    signals = Bungiesearch.BUNGIE['SIGNALS']
+    signals = settings.BUNGIESEARCH['SIGNALS']
     if 'SIGNAL_CLASS' in signals:
         signal_path = signals['SIGNAL_CLASS'].split('.')
         signal_module = import_module('.'.join(signal_path[:-1]))
@@ -19,17 +29,162 @@ def get_signal_processor():
     return signal_class()
 
 
+def connect_dependency_signals():
+    '''
+    Connects the signals of the related models declared in `depends_on` of the loaded ModelIndex classes whose models are
+    processed by a signal processor, unless already connected.
+    '''
+    from . import Bungiesearch
+    with _dependency_lock:
+        for related_model, dependents in list(iteritems(Bungiesearch._model_dependencies)):
+            for dep_model, _ in dependents:
+                if _dependency_processors.get(dep_model):
+                    _dependency_processors[dep_model][0].connect_dependencies(related_model, dep_model)
+
+
+def dependency_loader(sender, signal, **kwargs):
+    '''
+    Receives the signals of all models until all the indices are loaded, so that the index modules are not imported at startup.
+    Loads the indices on the first change of any model, connects the signals of the related models declared in `depends_on`,
+    then disconnects itself. The change being sent is processed here if its sender was just connected, since receivers
+    connected while a signal is sent are not called.
+    '''
+    if kwargs.get('raw'):
+        return # Fixtures are loaded as is, and their dependents along with them.
+    from . import Bungiesearch
+    was_connected = sender in _dependency_senders
+    Bungiesearch.__load_settings__()
+    connect_dependency_signals()
+    if Bungiesearch.__loaded_indices__:
+        disconnect_dependency_loader()
+
+    processor = _dependency_senders.get(sender)
+    if was_connected or processor is None:
+        return
+    connectors = {signals.post_save: processor.dependency_save_connector,
+                  signals.pre_delete: processor.dependency_pre_delete_connector,
+                  signals.post_delete: processor.dependency_post_delete_connector,
+                  signals.m2m_changed: processor.dependency_m2m_connector}
+    connectors[signal](sender=sender, **kwargs)
+
+
+def connect_dependency_loader():
+    for signal in (signals.post_save, signals.pre_delete, signals.post_delete, signals.m2m_changed):
+        signal.connect(dependency_loader, dispatch_uid='bungiesearch_dependency_loader')
+
+
+def disconnect_dependency_loader():
+    for signal in (signals.post_save, signals.pre_delete, signals.post_delete, signals.m2m_changed):
+        signal.disconnect(dispatch_uid='bungiesearch_dependency_loader')
+
+
+def get_m2m_through(model, lookup):
+    '''
+    Returns the intermediary model of the many to many relation of `model` named by the lookup, or None if it is not one.
+    '''
+    if '__' in lookup:
+        return None # Only direct relations are tracked (cf. `dependency_m2m_connector`).
+    field = model._meta.get_field(lookup)
+    if not field.many_to_many:
+        return None
+    return getattr(field, 'through', None) or field.remote_field.through # Reverse relations hold the intermediary model.
+
+
+def get_current_batch():
+    '''
+    Returns the BatchIndexing instance active on the current thread, or None if signals are indexed as they come.
+    '''
+    return getattr(_batch_state, 'batch', None)
+
+
+class BatchIndexing(object):
+    '''
+    Suspends per-signal indexing on the current thread and reindexes all touched objects on exit.
+    Can be used as a context manager or as a decorator. Nested batches are merged into the outermost one.
+    If the batch raises, touched objects are still reindexed, but indexing errors are logged rather than raised over the exception.
+    '''
+    def __init__(self, bulk_size=100, refresh=True):
+        self.bulk_size = bulk_size
+        self.refresh = refresh
+        self._saved = defaultdict(set)
+        self._deleted = defaultdict(set)
+        self._outer = None
+
+    def add_saved(self, model, pk):
+        self._saved[model].add(pk)
+
+    def add_deleted(self, model, pk, item_es_id):
+        self._saved[model].discard(pk)
+        self._deleted[model].add(item_es_id)
+
+    def __enter__(self):
+        self._outer = get_current_batch()
+        if self._outer is None:
+            _batch_state.batch = self
+        return self._outer or self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._outer is not None:
+            return False
+        _batch_state.batch = None
+        if exc_type is None:
+            self.flush()
+            return False
+        # Changes made before the exception may have been committed, hence are still indexed, without hiding the exception.
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Could not index the objects changed in a batch which raised {}.'.format(exc_type.__name__))
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with BatchIndexing(bulk_size=self.bulk_size, refresh=self.refresh):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def flush(self):
+        '''
+        Reindexes the saved objects by primary key chunks and bulk deletes the deleted ones.
+        Indices are refreshed once, after all operations.
+        '''
+        from . import Bungiesearch
+        from .utils import update_index, update_index_by_pks
+        touched_indices = set()
+        for model, pks in iteritems(self._saved):
+            touched_indices.update(update_index_by_pks(model, pks, bulk_size=self.bulk_size, refresh=False))
+
+        for model, item_es_ids in iteritems(self._deleted):
+            if item_es_ids:
+                update_index(list(item_es_ids), model.__name__, action='delete', bulk_size=self.bulk_size, refresh=False)
+                touched_indices.update(Bungiesearch.get_index(model, via_class=True))
+
+        self._saved.clear()
+        self._deleted.clear()
+        if self.refresh and touched_indices:
+            Bungiesearch().get_es_instance().indices.refresh(index=','.join(sorted(touched_indices)))
+            invalidate_results(touched_indices)
+
+
 class BungieSignalProcessor(object):
 
     __index_lock = Lock()
     __items_to_be_indexed = defaultdict(list)
 
     def post_save_connector(self, sender, instance, **kwargs):
+        from . import Bungiesearch
+        from .utils import update_index
         try:
             Bungiesearch.get_index(sender, via_class=True)
         except KeyError:
             return  # This model is not managed by Bungiesearch.
 
+        batch = get_current_batch()
+        if batch is not None:
+            batch.add_saved(sender, instance.pk)
+            return
+
         try:
             buffer_size = Bungiesearch.BUNGIE['SIGNALS']['BUFFER_SIZE']
         except KeyError:
@@ -47,17 +202,168 @@ class BungieSignalProcessor(object):
             update_index(items, sender.__name__, bulk_size=buffer_size)
 
     def pre_delete_connector(self, sender, instance, **kwargs):
+        from . import Bungiesearch
+        from .utils import delete_index_item
         try:
             Bungiesearch.get_index(sender, via_class=True)
         except KeyError:
             return  # This model is not managed by Bungiesearch.
 
+        batch = get_current_batch()
+        if batch is not None:
+            Bungiesearch.__load_settings__()
+            item_es_id = Bungiesearch.get_model_index(sender.__name__).fields['_id'].value(instance)
+            batch.add_deleted(sender, instance.pk, item_es_id)
+            return
+
         delete_index_item(instance, sender.__name__)
 
+    def index_pks(self, model, pks):
+        '''
+        Reindexes the objects of the provided primary keys, outside of the per instance signals (e.g. dependents or bulk operations).
+        '''
+        from .utils import update_index_by_pks
+        batch = get_current_batch()
+        if batch is not None:
+            for pk in pks:
+                batch.add_saved(model, pk)
+            return
+
+        update_index_by_pks(model, pks)
+
+    def dependency_save_connector(self, sender, instance, **kwargs):
+        from . import Bungiesearch
+        if kwargs.get('raw'):
+            return # Fixtures are loaded as is, and their dependents along with them.
+        for dep_model, queryset in Bungiesearch.get_dependents(sender, [instance.pk]):
+            self.index_pks(dep_model, queryset.values_list('pk', flat=True))
+
+    def dependency_pre_delete_connector(self, sender, instance, **kwargs):
+        from . import Bungiesearch
+        # Dependents must be found before the relation disappears, but reindexed once the object is deleted.
+        instance._bungiesearch_dependents = [(dep_model, list(queryset.values_list('pk', flat=True)))
+                                             for dep_model, queryset in Bungiesearch.get_dependents(sender, [instance.pk])]
+
+    def dependency_post_delete_connector(self, sender, instance, **kwargs):
+        for dep_model, pks in instance.__dict__.pop('_bungiesearch_dependents', []):
+            if pks:
+                self.index_pks(dep_model, pks)
+
+    def dependency_m2m_connector(self, sender, instance, action, model, pk_set, **kwargs):
+        from . import Bungiesearch
+        instance_model = type(instance)
+        if action == 'pre_clear':
+            # pk_set is not provided when clearing, so let's find the related dependents before they are removed.
+            instance._bungiesearch_cleared = [pk for dep_model, queryset in Bungiesearch.get_dependents(instance_model, [instance.pk])
+                                              if dep_model is model for pk in queryset.values_list('pk', flat=True)]
+            return
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        if action == 'post_clear':
+            pk_set = instance.__dict__.pop('_bungiesearch_cleared', [])
+
+        if pk_set and any(dep_model is model for dep_model, _ in Bungiesearch._model_dependencies.get(instance_model, [])):
+            self.index_pks(model, pk_set)
+        if any(dep_model is instance_model for dep_model, _ in Bungiesearch._model_dependencies.get(model, [])):
+            self.index_pks(instance_model, [instance.pk])
+
+    def connect_dependencies(self, related_model, dep_model):
+        '''
+        Connects the signals of a related model on which documents of `dep_model` depend, which reindex these documents.
+        Each related model is connected once, whichever the number of models depending on it.
+        '''
+        from . import Bungiesearch
+        if related_model not in _dependency_senders:
+            signals.post_save.connect(self.dependency_save_connector, sender=related_model, dispatch_uid='bungiesearch_dependency_save')
+            signals.pre_delete.connect(self.dependency_pre_delete_connector, sender=related_model, dispatch_uid='bungiesearch_dependency_pre_delete')
+            signals.post_delete.connect(self.dependency_post_delete_connector, sender=related_model, dispatch_uid='bungiesearch_dependency_post_delete')
+            _dependency_senders[related_model] = self
+        for dependent, lookup in Bungiesearch._model_dependencies.get(related_model, []):
+            through = get_m2m_through(dependent, lookup) if dependent is dep_model else None
+            if through is not None and through not in _dependency_senders:
+                signals.m2m_changed.connect(self.dependency_m2m_connector, sender=through, dispatch_uid='bungiesearch_dependency_m2m')
+                _dependency_senders[through] = self
+
+    def disconnect_dependencies(self, related_model, dep_model):
+        from . import Bungiesearch
+        signals.post_save.disconnect(sender=related_model, dispatch_uid='bungiesearch_dependency_save')
+        signals.pre_delete.disconnect(sender=related_model, dispatch_uid='bungiesearch_dependency_pre_delete')
+        signals.post_delete.disconnect(sender=related_model, dispatch_uid='bungiesearch_dependency_post_delete')
+        _dependency_senders.pop(related_model, None)
+        for dependent, lookup in Bungiesearch._model_dependencies.get(related_model, []):
+            through = get_m2m_through(dependent, lookup) if dependent is dep_model else None
+            if through is not None:
+                signals.m2m_changed.disconnect(sender=through, dispatch_uid='bungiesearch_dependency_m2m')
+                _dependency_senders.pop(through, None)
+
+    def setup_dependencies(self, model):
+        '''
+        Reindexes the documents of the model when the related models declared in `depends_on` of its ModelIndex classes change.
+        Since the models are set up before the indices are loaded, the signals of the related models are connected by the
+        `dependency_loader` on the first change of any model.
+        '''
+        with _dependency_lock:
+            _dependency_processors.setdefault(model, []).append(self)
+        connect_dependency_loader()
+
+    def teardown_dependencies(self, model):
+        '''
+        Disconnects the signals of the related models on which the model depends, unless another signal processor is set up
+        for the model. The signals of related models on which other models depend remain connected.
+        '''
+        from . import Bungiesearch
+        with _dependency_lock:
+            processors = _dependency_processors.get(model, [])
+            if self in processors:
+                processors.remove(self)
+            if processors:
+                return
+            _dependency_processors.pop(model, None)
+            for related_model, dependents in list(iteritems(Bungiesearch._model_dependencies)):
+                dep_models = set(dependent for dependent, _ in dependents)
+                if model in dep_models:
+                    self.disconnect_dependencies(related_model, model)
+                    for dep_model in dep_models:
+                        if _dependency_processors.get(dep_model):
+                            _dependency_processors[dep_model][0].connect_dependencies(related_model, dep_model)
+
     def setup(self, model):
         signals.post_save.connect(self.post_save_connector, sender=model)
         signals.pre_delete.connect(self.pre_delete_connector, sender=model)
+        self.setup_dependencies(model)
 
     def teardown(self, model):
         signals.pre_delete.disconnect(self.pre_delete_connector, sender=model)
         signals.post_save.disconnect(self.post_save_connector, sender=model)
+        self.teardown_dependencies(model)
+
+
+class BungieOutboxSignalProcessor(BungieSignalProcessor):
+    '''
+    Writes each change to the `IndexQueueItem` outbox table, in the same transaction as the change itself,
+    instead of indexing it. The queue is processed by the `process_index_queue` management command.
+    Changes are queued even within `BatchIndexing`: the queue is already drained in deduplicated bulk batches, whereas
+    collecting changes until the end of the batch would lose them if the process stopped before then.
+    '''
+    def post_save_connector(self, sender, instance, **kwargs):
+        from . import Bungiesearch
+        from .utils import enqueue_index_item
+        Bungiesearch.__load_settings__()
+        if not Bungiesearch.get_index(sender, via_class=True):
+            return  # This model is not managed by Bungiesearch.
+
+        enqueue_index_item(sender, instance.pk)
+
+    def pre_delete_connector(self, sender, instance, **kwargs):
+        from . import Bungiesearch
+        from .utils import enqueue_index_item
+        Bungiesearch.__load_settings__()
+        if not Bungiesearch.get_index(sender, via_class=True):
+            return  # This model is not managed by Bungiesearch.
+
+        item_es_id = Bungiesearch.get_model_index(sender.__name__).fields['_id'].value(instance)
+        enqueue_index_item(sender, instance.pk, action='delete', document_id=item_es_id)
+
+    def index_pks(self, model, pks):
+        from .utils import enqueue_index_items
+        enqueue_index_items(model, pks)
@@ -0,0 +1,55 @@
+from copy import deepcopy
+from threading import Event, Lock
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''
+    Coalesces concurrent calls sharing the same key: the first caller runs the function, and the callers arriving while it
+    runs wait for its result (or exception) instead of running it again.
+    Results are deep copied when shared, so that each caller may modify its own.
+    '''
+    def __init__(self):
+        self._lock = Lock()
+        self._calls = {}
+
+    def do(self, key, func, timeout=None):
+        '''
+        Returns the result of `func`, or of the identical call in flight.
+        :param key: hashable key identifying identical calls.
+        :param timeout: maximum number of seconds to wait for the call in flight, after which `func` is called directly.
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(timeout):
+                return func()
+            if call.error is not None:
+                raise call.error
+            return deepcopy(call.result)
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                shared = call.waiters > 0
+            call.done.set()
+        return deepcopy(call.result) if shared else call.result
@@ -1,18 +1,28 @@
+from collections import defaultdict
+from datetime import timedelta
+from uuid import uuid4
+
 from dateutil.parser import parse as parsedt
+from django.conf import settings
+from django.db import router
+from django.db.models import Q
 from django.utils import timezone
+from six import iteritems, text_type
 
 from elasticsearch.exceptions import NotFoundError
 
 from . import Bungiesearch
+from .cache import invalidate_results
 from .logger import logger
 
 try:
     from elasticsearch.helpers import bulk_index
 except ImportError:
     from elasticsearch.helpers import bulk as bulk_index
+from elasticsearch.helpers import BulkIndexError
 
 
-def update_index(model_items, model_name, action='index', bulk_size=100, num_docs=-1, start_date=None, end_date=None, refresh=True):
+def update_index(model_items, model_name, action='index', bulk_size=100, num_docs=-1, start_date=None, end_date=None, refresh=True, compress=False):
     '''
     Updates the index for the provided model_items.
     :param model_items: a list of model_items (django Model instances, or proxy instances) which are to be indexed/updated or deleted.
@@ -20,25 +30,40 @@ def update_index(model_items, model_name, action='index', bulk_size=100, num_doc
     corresponding to obects in the index.
     :param model_name: doctype, which must also be the model name.
     :param action: the action that you'd like to perform on this group of data. Must be in ('index', 'delete') and defaults to 'index.'
+    Deleting documents which are not in the index is not an error.
     :param bulk_size: bulk size for indexing. Defaults to 100.
     :param num_docs: maximum number of model_items from the provided list to be indexed.
     :param start_date: start date for indexing. Must be as YYYY-MM-DD.
     :param end_date: end date for indexing. Must be as YYYY-MM-DD.
     :param refresh: a boolean that determines whether to refresh the index, making all operations performed since the last refresh
     immediately available for search, instead of needing to wait for the scheduled Elasticsearch execution. Defaults to True.
+    Cached search results are only invalidated when refreshing, since searches still return the previous documents until then.
+    :param compress: set to True to gzip the bulk requests, as with `http_compress` in BUNGIESEARCH['ES_SETTINGS'].
     :note: If model_items contain multiple models, then num_docs is applied to *each* model. For example, if bulk_size is set to 5,
     and item contains models Article and Article2, then 5 model_items of Article *and* 5 model_items of Article2 will be indexed.
     '''
-    src = Bungiesearch()
+    if compress:
+        src = Bungiesearch(**dict(settings.BUNGIESEARCH.get('ES_SETTINGS', {}), http_compress=True))
+    else:
+        src = Bungiesearch()
 
     if action == 'delete' and not hasattr(model_items, '__iter__'):
         raise ValueError("If action is 'delete', model_items must be an iterable of primary keys.")
 
+    unmatched_items = []
+    if action == 'index' and src.get_index(model_name):
+        index_instance = src.get_model_index(model_name)
+        if index_instance.indexing_filter is not None:
+            model_items, unmatched_items = apply_indexing_filter(index_instance, model_items)
+
     logger.info('Getting index for model {}.'.format(model_name))
     for index_name in src.get_index(model_name):
         index_instance = src.get_model_index(model_name)
         model = index_instance.get_model()
 
+        if unmatched_items:
+            delete_unmatched_items(src, index_instance, index_name, unmatched_items)
+
         if num_docs == -1:
             if isinstance(model_items, (list, tuple)):
                 num_docs = len(model_items)
@@ -57,11 +82,41 @@ def update_index(model_items, model_name, action='index', bulk_size=100, num_doc
         for next_step in range(bulk_size, max_docs, bulk_size):
             logger.info('{}: documents {} to {} of {} total on index {}.'.format(action.capitalize(), prev_step, next_step, num_docs, index_name))
             data = create_indexed_document(index_instance, model_items[prev_step:next_step], action)
-            bulk_index(src.get_es_instance(), data, index=index_name, doc_type=model.__name__, raise_on_error=True)
+            if action == 'delete':
+                bulk_delete(src, data, index_name, model.__name__)
+            else:
+                bulk_index(src.get_es_instance(), data, index=index_name, doc_type=model.__name__, raise_on_error=True)
             prev_step = next_step
 
         if refresh:
             src.get_es_instance().indices.refresh(index=index_name)
+            invalidate_results([index_name])
+
+
+def update_index_by_pks(model, pks, bulk_size=100, refresh=True):
+    '''
+    Reindexes the objects of the provided primary keys, fetching them by chunks of `bulk_size` sorted primary keys.
+    Objects which do not match the indexing filter of the ModelIndex anymore are deleted from the index.
+    :param model: model class of the objects.
+    :param pks: iterable of primary keys.
+    :param refresh: set to True to refresh the index once all objects are reindexed.
+    :return: the list of index names which were updated.
+    '''
+    pks = sorted(set(pks))
+    if not pks:
+        return []
+
+    # Reading from the primary database, since replicas may not have the freshly saved rows yet.
+    queryset = model._default_manager.using(router.db_for_write(model))
+    for start in range(0, len(pks), bulk_size):
+        model_items = list(queryset.filter(pk__in=pks[start:start + bulk_size]))
+        update_index(model_items, model.__name__, bulk_size=bulk_size, refresh=False)
+
+    indices = Bungiesearch.get_index(model.__name__)
+    if refresh:
+        Bungiesearch().get_es_instance().indices.refresh(index=','.join(indices))
+        invalidate_results(indices)
+    return indices
 
 
 def delete_index_item(item, model_name, refresh=True):
@@ -71,6 +126,7 @@ def delete_index_item(item, model_name, refresh=True):
     :param model_name: doctype, which must also be the model name.
     :param refresh: a boolean that determines whether to refresh the index, making all operations performed since the last refresh
     immediately available for search, instead of needing to wait for the scheduled Elasticsearch execution. Defaults to True.
+    Cached search results are only invalidated when refreshing.
     '''
     src = Bungiesearch()
 
@@ -85,6 +141,7 @@ def delete_index_item(item, model_name, refresh=True):
 
         if refresh:
             src.get_es_instance().indices.refresh(index=index_name)
+            invalidate_results([index_name])
 
 
 def create_indexed_document(index_instance, model_items, action):
@@ -103,6 +160,50 @@ def create_indexed_document(index_instance, model_items, action):
     return data
 
 
+def apply_indexing_filter(index_instance, model_items):
+    '''
+    Restricts the model items to those matching `indexing_filter` of the ModelIndex.
+    Querysets are filtered in SQL. Lists of instances are checked with a single query, and the items which do not match
+    are returned separately in order to be removed from the index.
+    :return: a tuple of the matching items and of the list of unmatched items.
+    '''
+    if not isinstance(model_items, (list, tuple)):
+        return model_items.filter(index_instance.indexing_filter), []
+
+    # Instances are typically freshly saved ones, hence read from the primary database since replicas may lag behind.
+    model = index_instance.get_model()
+    pks = [item.pk for item in model_items]
+    matching_pks = set(model._default_manager.using(router.db_for_write(model)).filter(index_instance.indexing_filter, pk__in=pks).values_list('pk', flat=True))
+    matching, unmatched = [], []
+    for item in model_items:
+        (matching if item.pk in matching_pks else unmatched).append(item)
+    return matching, unmatched
+
+
+def bulk_delete(src, data, index_name, model_name):
+    '''
+    Bulk deletes documents, ignoring those which are not in the index (e.g. objects deleted before being indexed).
+    :raise BulkIndexError: if any other document could not be deleted.
+    '''
+    _, errors = bulk_index(src.get_es_instance(), data, index=index_name, doc_type=model_name, raise_on_error=False)
+    errors = [error for error in errors if error.get('delete', {}).get('status') != 404]
+    if errors:
+        raise BulkIndexError('{} document(s) failed to delete from index {}.'.format(len(errors), index_name), errors)
+
+
+def delete_unmatched_items(src, index_instance, index_name, model_items):
+    '''
+    Deletes from the index the documents of items which no longer match the indexing filter. Those may never have been
+    indexed, so missing documents are ignored.
+    '''
+    model_name = index_instance.get_model().__name__
+    data = [{'_id': index_instance.fields['_id'].value(item), '_op_type': 'delete'} for item in model_items]
+    _, errors = bulk_index(src.get_es_instance(), data, index=index_name, doc_type=model_name, raise_on_error=False)
+    for error in errors:
+        if error.get('delete', {}).get('status') != 404:
+            logger.warning('Could not delete unmatched {} document from index {}: {}.'.format(model_name, index_name, error))
+
+
 def filter_model_items(index_instance, model_items, model_name, start_date, end_date):
     ''' Filters the model items queryset based on start and end date.'''
     if index_instance.updated_field is None:
@@ -118,3 +219,94 @@ def filter_model_items(index_instance, model_items, model_name, start_date, end_
 
 def __str_to_tzdate__(date_str):
     return timezone.make_aware(parsedt(date_str), timezone.get_current_timezone())
+
+
+def enqueue_index_item(model, pk, action='index', document_id=None):
+    '''
+    Writes an outbox row for the provided object, to be processed by `drain_index_queue`.
+    :param model: model class of the object.
+    :param pk: primary key of the object.
+    :param action: either 'index' or 'delete'.
+    :param document_id: elasticsearch document id of the object, required if action is 'delete'.
+    '''
+    from .models import IndexQueueItem
+    if action == 'delete' and document_id is None:
+        raise ValueError("If action is 'delete', the document_id of the object must be provided.")
+    IndexQueueItem.objects.create(model_name=model.__name__, object_pk=text_type(pk), action=action,
+                                  document_id=None if document_id is None else text_type(document_id))
+
+
+def enqueue_index_items(model, pks, action='index'):
+    '''
+    Writes one outbox row per provided primary key, to be indexed.
+    '''
+    from .models import IndexQueueItem
+    IndexQueueItem.objects.bulk_create([IndexQueueItem(model_name=model.__name__, object_pk=text_type(pk), action=action) for pk in pks])
+
+
+def index_queue_lag():
+    '''
+    Returns a tuple of the number of queued items and the age (as a timedelta) of the oldest one, or None if the queue is empty.
+    '''
+    from .models import IndexQueueItem
+    oldest = IndexQueueItem.objects.order_by('created').values_list('created', flat=True).first()
+    if oldest is None:
+        return 0, None
+    return IndexQueueItem.objects.count(), timezone.now() - oldest
+
+
+def drain_index_queue(batch_size=500, claim_timeout=300, max_batches=None, refresh=True):
+    '''
+    Processes the outbox queue in deduplicated bulk batches until it is empty (or max_batches is reached).
+    Each batch is claimed with an atomic update, so several consumers can drain the queue concurrently without overlap.
+    :param batch_size: number of queue rows claimed per batch, also used as the bulk size.
+    :param claim_timeout: seconds after which a batch claimed by a consumer which did not finish it can be claimed again.
+    :param max_batches: maximum number of batches to process, or None to process until the queue is empty.
+    :param refresh: refresh the touched indices after each batch.
+    :return: the number of queue rows processed.
+    :note: If processing a batch raises, its rows remain claimed, and are processed again once claim_timeout has elapsed.
+    '''
+    from .models import IndexQueueItem
+
+    token = uuid4().hex
+    processed = batches = 0
+    while max_batches is None or batches < max_batches:
+        now = timezone.now()
+        claimable = IndexQueueItem.objects.filter(Q(claimed_by__isnull=True) | Q(claimed_at__lt=now - timedelta(seconds=claim_timeout)))
+        ids = list(claimable.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        if not claimable.filter(pk__in=ids).update(claimed_by=token, claimed_at=now):
+            continue # Another consumer claimed these rows first.
+        claimed = IndexQueueItem.objects.filter(claimed_by=token)
+
+        # Only the latest action of each object matters. Rows are keyed by primary key whichever their action, so that saving
+        # then deleting an object only deletes it (and conversely), even if its index uses another `id_field`.
+        latest_actions = {}
+        for model_name, object_pk, action, document_id in claimed.order_by('pk').values_list('model_name', 'object_pk', 'action', 'document_id'):
+            latest_actions[(model_name, object_pk)] = (action, document_id)
+
+        to_index, to_delete = defaultdict(list), defaultdict(list)
+        for (model_name, object_pk), (action, document_id) in iteritems(latest_actions):
+            if action == 'index':
+                to_index[model_name].append(object_pk)
+            else:
+                to_delete[model_name].append(document_id)
+
+        src = Bungiesearch()
+        touched_indices = set()
+        for model_name, pks in iteritems(to_index):
+            model = src.get_model_index(model_name).get_model()
+            touched_indices.update(update_index_by_pks(model, pks, bulk_size=batch_size, refresh=False))
+        for model_name, item_es_ids in iteritems(to_delete):
+            update_index(item_es_ids, model_name, action='delete', bulk_size=batch_size, refresh=False)
+            touched_indices.update(src.get_index(model_name))
+
+        processed += claimed.count()
+        claimed.delete()
+        batches += 1
+        if refresh and touched_indices:
+            src.get_es_instance().indices.refresh(index=','.join(sorted(touched_indices)))
+            invalidate_results(touched_indices)
+
+    return processed
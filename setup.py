@@ -21,6 +21,10 @@ install_requires = [
     'six',
 ]
 
+extras_require = {
+    'fast': ['orjson; python_version >= "3.6"'], # Used by bungiesearch.serializers.FastJSONSerializer.
+}
+
 tests_require = []
 
 # use external unittest for 2.6
@@ -53,5 +57,6 @@ setup(
     ],
     keywords="elasticsearch haystack django bungiesearch",
     install_requires=install_requires,
+    extras_require=extras_require,
     dependency_links=['https://github.com/elasticsearch/elasticsearch-dsl-py#egg=elasticsearch-dsl-py'],
 )
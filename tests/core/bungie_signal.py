@@ -20,9 +20,11 @@ class BungieTestSignalProcessor(BungieSignalProcessor):
     def setup(self, model):
         signals.post_save.connect(self.handle_save, sender=model)
         signals.pre_delete.connect(self.handle_delete, sender=model)
+        self.setup_dependencies(model)
         self.setup_ran = True
 
     def teardown(self, model):
         signals.pre_delete.disconnect(self.handle_delete, sender=model)
         signals.post_save.disconnect(self.handle_save, sender=model)
+        self.teardown_dependencies(model)
         self.teardown_ran = True
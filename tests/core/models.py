@@ -3,6 +3,13 @@ from django.db import models
 from bungiesearch.managers import BungiesearchManager
 
 
+class Author(models.Model):
+    name = models.TextField()
+
+    class Meta:
+        app_label = 'core'
+
+
 class Article(models.Model):
     title = models.TextField(db_index=True)
     authors = models.TextField(blank=True)
@@ -19,6 +26,7 @@ class Article(models.Model):
     positive_feedback = models.PositiveIntegerField(null=True, blank=True, default=0)
     negative_feedback = models.PositiveIntegerField(null=True, blank=True, default=0)
     popularity_index = models.IntegerField(default=0)
+    author = models.ForeignKey(Author, null=True, blank=True, on_delete=models.SET_NULL)
 
     objects = BungiesearchManager()
 
@@ -65,3 +73,22 @@ class Unmanaged(models.Model):
 
     class Meta:
         app_label = 'core'
+
+
+class SecondaryManager(models.Model):
+    field_title = models.TextField(db_index=True)
+
+    objects = models.Manager()
+    indexed = BungiesearchManager()
+
+    class Meta:
+        app_label = 'core'
+
+
+class NamedManager(models.Model):
+    field_title = models.TextField(db_index=True)
+
+    indexed = BungiesearchManager()
+
+    class Meta:
+        app_label = 'core'
@@ -1,4 +1,5 @@
-from bungiesearch.aliases import SearchAlias
+from bungiesearch.aliases import Param, SearchAlias, SearchTemplate
+from elasticsearch_dsl import Q
 from core.models import Article, NoUpdatedField
 
 
@@ -44,3 +45,10 @@ class BisIndex(SearchAlias):
     class Meta:
         models = (Article,)
         alias_name = 'bisindex'
+
+class TitleTemplate(SearchAlias):
+    template = SearchTemplate(Q('bool', must=[Q('match', title=Param('title'))], filter=[Q('range', tweet_count={'gte': Param('min_tweets')})]))
+
+    class Meta:
+        models = (Article,)
+        alias_name = 'title_template'
@@ -1,6 +1,8 @@
+from django.db.models import Q
+
 from bungiesearch.fields import DateField, NumberField, StringField
 from bungiesearch.indices import ModelIndex
-from core.models import Article, NoUpdatedField, User
+from core.models import Article, Author, NoUpdatedField, User
 
 from .analysis import edge_ngram_analyzer
 
@@ -9,6 +11,7 @@ class ArticleIndex(ModelIndex):
     effective_date = DateField(eval_as='obj.created if obj.created and obj.published > obj.created else obj.published')
     meta_data = StringField(eval_as='" ".join([fld for fld in [obj.link, str(obj.tweet_count), obj.raw] if fld])')
     text = StringField(template='article.txt', analyzer=edge_ngram_analyzer)
+    author_name = StringField(eval_as='obj.author.name if obj.author else ""')
 
     class Meta:
         model = Article
@@ -19,6 +22,7 @@ class ArticleIndex(ModelIndex):
                     'description': {'boost': 1.35},
                     'full_text': {'boost': 1.125}}
         default = True
+        depends_on = {Author: 'author'}
 
 
 class UserIndex(ModelIndex):
@@ -49,3 +53,4 @@ class NoUpdatedFieldIndex(ModelIndex):
         exclude = ('field_description',)
         optimize_queries = True
         indexing_query = NoUpdatedField.objects.defer(*exclude).select_related().all()
+        indexing_filter = ~Q(field_title__startswith='Hidden')
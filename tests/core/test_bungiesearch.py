@@ -1,20 +1,44 @@
-from datetime import datetime
+import json
+import os
+import sys
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from threading import Event, Thread
+from time import sleep
+from unittest import skipIf
 
+from django.apps import apps
+from django.conf import settings
 from django.core.management import call_command
+from django.db.models import signals
 from django.test import TestCase, override_settings
+from django.utils.translation import ugettext_lazy
 from six import iteritems
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 
 import pytz
 from bungiesearch import Bungiesearch
-from bungiesearch.utils import update_index
-from elasticsearch.exceptions import RequestError
+from bungiesearch.cache import _caches, get_index_generations, get_result_cache
+from bungiesearch.managers import BungiesearchManager, BungiesearchQuerySet
+from bungiesearch.models import IndexQueueItem
+from bungiesearch.pagination import SearchPaginator, supports_search_after
+from bungiesearch.pool import fetch_in_bulk, get_mapping_pool
+from bungiesearch.serializers import FastJSONSerializer
+from bungiesearch.signals import BungieOutboxSignalProcessor
+from bungiesearch.singleflight import SingleFlight
+from bungiesearch.utils import update_index, update_index_by_pks
+from elasticsearch.exceptions import RequestError, SerializationError
 from core.bungie_signal import BungieTestSignalProcessor
-from core.models import (Article, ManangedButEmpty, NoUpdatedField, Unmanaged,
-                         User)
+from core.models import (Article, Author, ManangedButEmpty, NamedManager,
+                         NoUpdatedField, SecondaryManager, Unmanaged, User)
 from core.search_indices import ArticleIndex, UserIndex
 
 
 class CoreTestCase(TestCase):
+    databases = '__all__'
+    multi_db = True # Django < 2.2.
+
     @classmethod
     def setUpClass(cls):
         # Let's start by creating the index and mapping.
@@ -89,6 +113,7 @@ class CoreTestCase(TestCase):
                                            'title': {'type': 'string', 'boost': 1.75, 'analyzer': 'snowball'},
                                            'authors': {'type': 'string', 'analyzer': 'snowball'},
                                            'meta_data': {'type': 'string', 'analyzer': 'snowball'},
+                                           'author_name': {'type': 'string', 'analyzer': 'snowball'},
                                            'link': {'type': 'string', 'analyzer': 'snowball'},
                                            'effective_date': {'type': 'date'},
                                            'tweet_count': {'type': 'integer'},
@@ -228,6 +253,20 @@ class CoreTestCase(TestCase):
         expected = {'query': {'bool': {'filter': [{'term': {'title': 'title filter'}}], 'must': [{'match': {'title': 'title query'}}]}}}
         self.assertEqual(alias_dictd, expected, 'Alias on Bungiesearch instance did not return the expected dictionary.')
 
+    def test_search_template(self):
+        expected = {'query': {'bool': {'must': [{'match': {'title': 'title'}}], 'filter': [{'range': {'tweet_count': {'gte': 1}}}]}}}
+        template_search = Article.objects.bsearch_title_template(title='title', min_tweets=1)
+        self.assertEqual(template_search.to_dict(), expected, 'Template alias did not return the expected JSON query.')
+        self.assertEqual(Article.objects.bsearch_title_template(title='other', min_tweets=2).to_dict()['query']['bool']['must'][0], {'match': {'title': 'other'}}, 'Template alias did not render its parameters.')
+        self.assertEqual(template_search.to_dict(), expected, 'Rendering a template modified a previous rendering.')
+        self.assertEqual(template_search.filter('term', link='a link').sort('created').to_dict(),
+                         {'query': {'bool': {'must': [expected['query'], {'bool': {'filter': [{'term': {'link': 'a link'}}]}}]}}, 'sort': ['created']},
+                         'Template alias did not combine with the filter and sort set on the search.')
+        self.assertRaises(TypeError, Article.objects.bsearch_title_template, title='title')
+        db_items = list(Article.objects.all())
+        self.assertTrue(all([result in db_items for result in template_search]), 'Template alias did not return articles.')
+        self.assertEqual(len(template_search), Article.objects.filter(tweet_count__gte=1).count(), 'Template alias count does not apply the template query.')
+
     def test_search_alias_model(self):
         self.assertEqual(Article.objects.bsearch_get_alias_for_test().get_model(), Article, 'Unexpected get_model information on search alias.')
         self.assertEqual(Article.objects.search.bsearch_title('title query').bsearch_get_alias_for_test().get_model(), Article, 'Unexpected get_model information on search alias.')
@@ -292,6 +331,218 @@ class CoreTestCase(TestCase):
         find_five = Article.objects.search.query('match', title='five')
         self.assertEqual(len(find_five), 0, 'Searching for "five" in title did not return exactly zero results (got {})'.format(find_five))
 
+    def test_batch_indexing(self):
+        '''
+        Tests that objects saved within a batch are only indexed when the batch exits.
+        '''
+        batch_art = {'title': 'Title six',
+                     'description': 'Batch indexing',
+                     'link': 'http://example.com/batch',
+                     'published': pytz.UTC.localize(datetime(year=2015, month=7, day=13)),
+                     'updated': pytz.UTC.localize(datetime(year=2015, month=7, day=20)),
+                     'tweet_count': 20}
+
+        with Bungiesearch.batch():
+            obj = Article.objects.create(**batch_art)
+            find_six = Article.objects.search.query('match', title='six')
+            self.assertEqual(len(find_six), 0, 'Searching for "six" within a batch returned {} items instead of zero.'.format(len(find_six)))
+
+        find_six = Article.objects.search.query('match', title='six')
+        self.assertEqual(len(find_six), 2, 'Searching for "six" after a batch did not return exactly two items (got {}).'.format(find_six))
+
+        @Bungiesearch.batch()
+        def delete_obj():
+            obj.delete()
+
+        delete_obj()
+        find_six = Article.objects.search.query('match', title='six')
+        self.assertEqual(len(find_six), 0, 'Searching for "six" after a batch delete did not return zero items (got {}).'.format(find_six))
+
+        with Bungiesearch.batch():
+            Article.objects.create(**batch_art).delete() # The document of this object is never indexed.
+        find_six = Article.objects.search.query('match', title='six')
+        self.assertEqual(len(find_six), 0, 'Searching for "six" after a batch creating and deleting it did not return zero items (got {}).'.format(find_six))
+
+        def failing_flush():
+            raise RuntimeError('Flush failed.')
+        batch = Bungiesearch.batch()
+        batch.flush = failing_flush
+        with self.assertRaises(KeyError, msg='A batch failing to index hid the exception raised within it.'):
+            with batch:
+                raise KeyError('Raised within the batch.')
+
+    def test_outbox_queue(self):
+        '''
+        Tests that the outbox signal processor queues changes which are then processed by the process_index_queue command.
+        '''
+        outbox_art = {'title': 'Title seven',
+                      'description': 'Outbox queue',
+                      'link': 'http://example.com/outbox',
+                      'published': pytz.UTC.localize(datetime(year=2015, month=7, day=13)),
+                      'updated': pytz.UTC.localize(datetime(year=2015, month=7, day=20)),
+                      'tweet_count': 20}
+        obj = Article.objects.create(**outbox_art)
+        outbox = BungieOutboxSignalProcessor()
+
+        outbox.pre_delete_connector(Article, obj)
+        outbox.post_save_connector(Article, obj)
+        outbox.pre_delete_connector(Article, obj)
+        self.assertEqual(IndexQueueItem.objects.count(), 3, 'The outbox signal processor did not queue exactly three items.')
+        self.assertEqual(set(IndexQueueItem.objects.values_list('object_pk', flat=True)), {str(obj.pk)},
+                         'Queued saves and deletes of the same object were not keyed by its primary key.')
+        self.assertEqual(set(IndexQueueItem.objects.filter(action='delete').values_list('document_id', flat=True)), {str(obj.pk)},
+                         'Queued deletes did not store the elasticsearch document id.')
+        call_command('process_index_queue', batch_size=2)
+        self.assertEqual(IndexQueueItem.objects.count(), 0, 'Processing the index queue did not empty it.')
+        find_seven = Article.objects.search.query('match', title='seven')
+        self.assertEqual(len(find_seven), 0, 'Searching for "seven" after a queued delete did not return zero items (got {}).'.format(find_seven))
+
+        outbox.post_save_connector(Article, obj)
+        call_command('process_index_queue')
+        find_seven = Article.objects.search.query('match', title='seven')
+        self.assertEqual(len(find_seven), 2, 'Searching for "seven" after a queued save did not return exactly two items (got {}).'.format(find_seven))
+        obj.delete()
+
+    def test_outbox_missing_document(self):
+        '''
+        Tests that a queued delete of a document which was never indexed does not stop the index queue.
+        '''
+        outbox = BungieOutboxSignalProcessor()
+        # Hidden titles do not match the indexing filter, hence are never indexed.
+        obj = NoUpdatedField.objects.create(field_title='Hidden outbox title', field_description='Never indexed.')
+        outbox.post_save_connector(NoUpdatedField, obj)
+        outbox.pre_delete_connector(NoUpdatedField, obj)
+        outbox.pre_delete_connector(NoUpdatedField, obj)
+        call_command('process_index_queue')
+        self.assertEqual(IndexQueueItem.objects.count(), 0, 'A queued delete of a document which was never indexed was not processed.')
+        obj.delete()
+
+    def test_dependency_reindexing(self):
+        '''
+        Tests that saving an object on which indexed documents depend reindexes these documents.
+        '''
+        author = Author.objects.create(name='Bungie writer')
+        dep_art = {'title': 'Title eight',
+                   'description': 'Dependency tracking',
+                   'link': 'http://example.com/dependency',
+                   'published': pytz.UTC.localize(datetime(year=2015, month=7, day=13)),
+                   'updated': pytz.UTC.localize(datetime(year=2015, month=7, day=20)),
+                   'tweet_count': 20,
+                   'author': author}
+        obj = Article.objects.create(**dep_art)
+        find_writer = Article.objects.search.query('match', author_name='writer')
+        self.assertEqual(len(find_writer), 2, 'Searching for "writer" in author name did not return exactly two items (got {}).'.format(find_writer))
+
+        author.name = 'Bungie editor'
+        author.save()
+        find_editor = Article.objects.search.query('match', author_name='editor')
+        self.assertEqual(len(find_editor), 2, 'Searching for "editor" in author name after saving the author did not return exactly two items (got {}).'.format(find_editor))
+
+        obj.delete()
+        author.delete()
+
+    def test_dependency_signals(self):
+        '''
+        Tests that dependency signals are connected on the first change of any model, only to the models declared in `depends_on`,
+        skip fixtures and are torn down.
+        '''
+        author = Author.objects.create(name='Bungie fixture')
+        self.assertTrue(signals.post_save.has_listeners(Author), 'Dependency signals were not connected to Author.')
+        self.assertFalse(signals.post_save.has_listeners(Unmanaged), 'Dependency signals were connected to a model without dependents.')
+
+        processor = Article.objects.signal_processor
+        with self.assertNumQueries(0):
+            processor.dependency_save_connector(Author, author, raw=True)
+
+        processor.teardown(Article)
+        try:
+            self.assertFalse(signals.post_save.has_listeners(Author), 'Tearing down the signal processor did not disconnect the dependency signals.')
+        finally:
+            processor.setup(Article)
+        # Until the next change, the dependency loader receives the signals of all models.
+        self.assertTrue(signals.post_save.has_listeners(Unmanaged), 'Setting up the signal processor again did not connect the dependency loader.')
+        author.name = 'Bungie loader'
+        with self.assertNumQueries(2): # The change connecting the dependency signals also looks up the dependents.
+            author.save()
+        self.assertTrue(signals.post_save.has_listeners(Author), 'The dependency loader did not connect the dependency signals.')
+        self.assertFalse(signals.post_save.has_listeners(Unmanaged), 'The dependency loader was not disconnected once the indices were loaded.')
+        author.delete()
+
+    def test_queryset_bulk_operations(self):
+        '''
+        Tests that queryset updates and deletes, which do not send post_save signals, keep the index up to date.
+        '''
+        bulk_art = {'title': 'Title nine',
+                    'description': 'Queryset bulk operations',
+                    'link': 'http://example.com/queryset',
+                    'published': pytz.UTC.localize(datetime(year=2015, month=7, day=13)),
+                    'updated': pytz.UTC.localize(datetime(year=2015, month=7, day=20)),
+                    'tweet_count': 20}
+        Article.objects.create(**bulk_art)
+
+        Article.objects.filter(title='Title nine').update(title='Title ten')
+        find_ten = Article.objects.search.query('match', title='ten')
+        self.assertEqual(len(find_ten), 2, 'Searching for "ten" after a queryset update did not return exactly two items (got {}).'.format(find_ten))
+
+        Article.objects.filter(title='Title ten').delete()
+        find_ten = Article.objects.search.query('match', title='ten')
+        self.assertEqual(len(find_ten), 0, 'Searching for "ten" after a queryset delete did not return zero items (got {}).'.format(find_ten))
+
+    def test_queryset_signal_processor(self):
+        '''
+        Tests that querysets use the signal processor of the manager which built them, whichever its name.
+        '''
+        queryset = SecondaryManager.indexed.filter(field_title='Secondary').exclude(pk=0)
+        self.assertIs(queryset._get_signal_processor(), SecondaryManager.indexed.signal_processor,
+                      'A queryset of a BungiesearchManager which is not named objects did not use its signal processor.')
+        author = Author.objects.create(name='Bungie related')
+        self.assertIs(author.article_set.all()._get_signal_processor(), Article.objects.signal_processor,
+                      'A queryset of a related manager did not use the signal processor of the default manager.')
+        author.delete()
+
+        class TitleQuerySet(BungiesearchQuerySet):
+            def titled(self, title):
+                return self.filter(title=title)
+        manager = BungiesearchManager.from_queryset(TitleQuerySet)()
+        manager.model, manager.signal_processor = Article, Article.objects.signal_processor
+        queryset = manager.titled('Title one')
+        self.assertIsInstance(queryset, TitleQuerySet, 'A BungiesearchManager built from a queryset did not use this queryset.')
+        self.assertIs(queryset._get_signal_processor(), Article.objects.signal_processor,
+                      'A queryset of a BungiesearchManager built from a queryset did not use its signal processor.')
+        self.assertEqual(Article.objects.db_manager(hints={'bungie': True}).all()._hints, {'bungie': True},
+                         'A queryset of a BungiesearchManager did not keep the routing hints of the manager.')
+
+    def test_default_manager(self):
+        '''
+        Tests that objects are read through the default manager when reindexing, whichever its name.
+        '''
+        obj = NamedManager.indexed.create(field_title='Named')
+        self.assertEqual(update_index_by_pks(NamedManager, [obj.pk], refresh=False), [], 'A model without any index was reindexed.')
+        obj.delete()
+
+    def test_indexing_filter(self):
+        '''
+        Tests that objects which stop matching the indexing filter are removed from the index.
+        '''
+        obj = NoUpdatedField.objects.create(field_title='Ephemeral title', field_description='Indexing filter.')
+        find_ephemeral = NoUpdatedField.objects.search.query('match', field_title='ephemeral')
+        self.assertEqual(len(find_ephemeral), 1, 'Searching for "ephemeral" did not return exactly one item (got {}).'.format(find_ephemeral))
+
+        obj.field_title = 'Hidden ephemeral title'
+        obj.save()
+        find_ephemeral = NoUpdatedField.objects.search.query('match', field_title='ephemeral')
+        self.assertEqual(len(find_ephemeral), 0, 'Searching for "ephemeral" after it stopped matching the indexing filter did not return zero items (got {}).'.format(find_ephemeral))
+        obj.delete()
+
+    def test_queryset_delete_unindexed(self):
+        '''
+        Tests that deleting in bulk objects which were never indexed, since they do not match the indexing filter, does not fail.
+        '''
+        NoUpdatedField.objects.create(field_title='Hidden title one', field_description='Never indexed.')
+        NoUpdatedField.objects.create(field_title='Hidden title two', field_description='Never indexed.')
+        NoUpdatedField.objects.filter(field_title__startswith='Hidden').delete()
+        self.assertFalse(NoUpdatedField.objects.filter(field_title__startswith='Hidden').exists(), 'Objects deleted in bulk were not deleted.')
+
     def test_manager_interference(self):
         '''
         This tests that saving an object which is not managed by Bungiesearch won't try to update the index for that model.
@@ -327,6 +578,386 @@ class CoreTestCase(TestCase):
         match_zero = Article.objects.search.query('match', text='example')
         self.assertEqual(len(match_zero), 0, 'Searching for "article" in text did not return exactly zero items (got {})'.format(match_zero))
 
+    def test_hydrate_from_source(self):
+        '''
+        Tests that instances can be built from the stored documents without querying the database.
+        '''
+        db_item = Article.objects.get(title='Title one')
+        # String fields, stored with their HTML tags stripped, are fetched from the database with a single query.
+        with self.assertNumQueries(1):
+            src_item = Article.objects.search_index('bungiesearch_demo').query('match', title='one').from_source()[0]
+            self.assertEqual(src_item.pk, db_item.pk, 'Hydrating from source did not return the expected object id.')
+            self.assertEqual(src_item.tweet_count, db_item.tweet_count, 'Hydrating from source did not set the tweet count.')
+            self.assertEqual(src_item.published, db_item.published, 'Hydrating from source did not convert the published date.')
+            self.assertEqual(src_item.title, db_item.title, 'Hydrating from source did not fetch the string fields from the database.')
+        with self.assertNumQueries(1):
+            self.assertEqual(src_item.popularity_index, db_item.popularity_index, 'Field not stored in the index was not fetched from the database.')
+
+        with self.assertNumQueries(1):
+            src_items = list(Article.objects.search_index('bungiesearch_demo').query('match', title='title').from_source())
+            src_texts = dict((item.pk, (item.title, item.description)) for item in src_items)
+        self.assertGreater(len(src_items), 1, 'Searching for "title" did not return several items.')
+        db_texts = dict((item.pk, (item.title, item.description)) for item in Article.objects.filter(pk__in=list(src_texts)))
+        self.assertEqual(src_texts, db_texts, 'Hydrated instances did not have the string fields of the database.')
+
+    def test_db_alias_read(self):
+        '''
+        Tests that results are mapped from DB_ALIAS_READ, and that search_index --database indexes the objects of that database.
+        '''
+        replicas = []
+        for article in Article.objects.all():
+            article.title = 'Replica {}'.format(article.title)
+            replicas.append(article)
+        Article._base_manager.using('replica').bulk_create(replicas)
+
+        search = Article.objects.search_index('bungiesearch_demo').query('match', title='one')
+        with override_settings(BUNGIESEARCH=dict(settings.BUNGIESEARCH, DB_ALIAS_READ='replica')):
+            with self.assertNumQueries(0, using='default'), self.assertNumQueries(1, using='replica'):
+                item = search._clone()[0]
+            self.assertEqual(item._state.db, 'replica', 'Mapped instance was not read from DB_ALIAS_READ.')
+            self.assertEqual(item.title, 'Replica Title one', 'Mapped instance was not fetched from DB_ALIAS_READ.')
+            self.assertEqual(search._clone().from_source()[0]._state.db, 'replica', 'Instance hydrated from source was not bound to DB_ALIAS_READ.')
+
+        find_replica = Article.objects.search_index('bungiesearch_demo').query('match', title='replica')
+        try:
+            call_command('search_index', action='update', models='Article', database='replica')
+            self.assertEqual(len(find_replica._clone()), len(replicas), 'search_index --database did not index the objects of that database.')
+        finally:
+            call_command('search_index', action='update', models='Article')
+        self.assertEqual(len(find_replica._clone()), 0, 'search_index did not index the objects of the default database.')
+
+    def test_instance_cache(self):
+        '''
+        Tests that mapped instances are served from the instance cache, and that bulk updates invalidate it.
+        '''
+        _caches.clear()
+        with override_settings(BUNGIESEARCH=dict(settings.BUNGIESEARCH, INSTANCE_CACHE={'TIMEOUT': 60})):
+            search = Article.objects.search_index('bungiesearch_demo').query('match', title='one')
+            with self.assertNumQueries(1):
+                self.assertEqual(search[0].title, 'Title one', 'Mapping with the instance cache enabled did not return the expected object.')
+            with self.assertNumQueries(0):
+                self.assertEqual(search[0].title, 'Title one', 'Mapping did not use the instance cache.')
+            Article.objects.filter(title='Title one').update(tweet_count=21)
+            with self.assertNumQueries(1):
+                self.assertEqual(search[0].tweet_count, 21, 'Queryset update did not invalidate the instance cache.')
+            Article.objects.filter(title='Title one').update(tweet_count=20)
+        _caches.clear()
+
+    def test_result_cache(self):
+        '''
+        Tests that search responses are cached until the searched index is updated.
+        '''
+        _caches.clear()
+        with override_settings(BUNGIESEARCH=dict(settings.BUNGIESEARCH, RESULT_CACHE={'TIMEOUT': 60})):
+            search = Article.objects.search_index('bungiesearch_demo').query('match', title='one')
+            article = search[0]
+            Bungiesearch().get_es_instance().delete('bungiesearch_demo', 'Article', article.pk, refresh=True)
+            self.assertEqual(search[0], article, 'Search response was not cached.')
+            self.assertEqual(search.cache(0)[0], [], 'Search with a zero cache timeout used the result cache.')
+            update_index([article], 'Article')
+            self.assertEqual(search[0], article, 'Updating the index did not invalidate the result cache.')
+        _caches.clear()
+
+    def test_result_cache_refresh(self):
+        '''
+        Tests that indexing without refreshing keeps the result cache, which is invalidated once the index is refreshed.
+        '''
+        _caches.clear()
+        article = Article.objects.get(title='Title one')
+        with override_settings(BUNGIESEARCH=dict(settings.BUNGIESEARCH, RESULT_CACHE={'TIMEOUT': 60})):
+            search = Article.objects.search_index('bungiesearch_demo').query('match', title='eleven')
+            self.assertEqual(search._clone()[:1], [], 'Searching for "eleven" returned items before any was indexed.')
+            generations = get_index_generations(get_result_cache(), ['bungiesearch_demo'])
+            try:
+                Article._base_manager.filter(pk=article.pk).update(title='Title eleven')
+                update_index([Article.objects.get(pk=article.pk)], 'Article', refresh=False)
+                self.assertEqual(get_index_generations(get_result_cache(), ['bungiesearch_demo']), generations,
+                                 'Indexing without refreshing invalidated the result cache before the documents were searchable.')
+                update_index_by_pks(Article, [article.pk])
+                self.assertEqual([item.pk for item in search._clone()[:1]], [article.pk], 'Refreshing the index did not invalidate the result cache.')
+            finally:
+                Article._base_manager.filter(pk=article.pk).update(title='Title one')
+                update_index_by_pks(Article, [article.pk])
+        _caches.clear()
+
+    def test_count_reuse(self):
+        '''
+        Tests that executed searches reuse the total of their response, and that cached counts are kept until the index is updated.
+        '''
+        _caches.clear()
+        with override_settings(BUNGIESEARCH=dict(settings.BUNGIESEARCH, RESULT_CACHE={'COUNT_TIMEOUT': 60})):
+            search = Article.objects.search_index('bungiesearch_demo').query('match', title='one')
+            article = search[0]
+            self.assertEqual(search.count(cache=True), 1, 'Count of the search did not return one hit.')
+            search.execute()
+            Bungiesearch().get_es_instance().delete('bungiesearch_demo', 'Article', article.pk, refresh=True)
+            self.assertEqual(len(search), 1, 'Length of an executed search is not the total of its response.')
+            self.assertEqual(search._clone().count(cache=True), 1, 'Count was not cached.')
+            self.assertEqual(search._clone().count(), 0, 'Count without cache used the result cache.')
+            update_index([article], 'Article')
+            self.assertEqual(search._clone().count(cache=True), 1, 'Updating the index did not invalidate the cached count.')
+        _caches.clear()
+
+    def test_serializer(self):
+        '''
+        Tests that the fast serializer handles the values of indexed fields, and that it is used by the elasticsearch clients.
+        '''
+        serializer = FastJSONSerializer()
+        data = {'published': datetime(2015, 1, 2, 3, 4, 5, tzinfo=pytz.UTC), 'day': date(2015, 1, 2), 'price': Decimal('1.5'),
+                'label': ugettext_lazy('label'), 'title': u'Caf\xe9', 'big': 2 ** 70}
+        self.assertEqual(serializer.loads(serializer.dumps(data)),
+                         {'published': '2015-01-02T03:04:05+00:00', 'day': '2015-01-02', 'price': 1.5, 'label': 'label', 'title': u'Caf\xe9', 'big': 2 ** 70},
+                         'Fast serializer did not serialize the values as expected.')
+        self.assertRaises(SerializationError, serializer.dumps, {'item': object()})
+        self.assertEqual(serializer.loads('{"title": "\\ud83d", "score": 1e400}'), {'title': u'\ud83d', 'score': float('inf')},
+                         'Fast serializer did not fall back to the json module for documents orjson does not decode.')
+        self.assertRaises(SerializationError, serializer.loads, '{"title": ')
+        with override_settings(BUNGIESEARCH=dict(settings.BUNGIESEARCH, SERIALIZER='bungiesearch.serializers.FastJSONSerializer')):
+            search = Article.objects.search.query('match', title='title')
+            self.assertTrue(isinstance(search.get_es_instance().transport.serializer, FastJSONSerializer), 'Serializer setting was not applied to the client.')
+            self.assertEqual(len(list(search)), len(list(Article.objects.search.query('match', title='title'))), 'Search with the fast serializer returned different results.')
+
+    def test_compressed_bulk(self):
+        '''
+        Tests that large request bodies are gzipped and that gzipped responses are accepted, against a local HTTP server.
+        '''
+        requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+                requests.append((self.headers.get('Content-Encoding'), self.headers.get('Accept-Encoding'), body.decode('utf-8')))
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                response = compressor.compress(b'{"took": 1, "errors": false, "items": []}') + compressor.flush()
+                self.send_response(200)
+                self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        server_thread = Thread(target=server.serve_forever)
+        server_thread.start()
+        try:
+            es = Bungiesearch(urls=['127.0.0.1:{}'.format(server.server_port)], http_compress=True, compress_threshold=200, force_new=True).get_es_instance()
+            actions = [{'index': {'_index': 'bungiesearch_demo', '_type': 'Article', '_id': pk}} for pk in range(10)]
+            self.assertEqual(es.bulk(body=actions)['items'], [], 'Gzipped response was not decoded.')
+            self.assertEqual(es.bulk(body=actions[:1])['items'], [], 'Gzipped response was not decoded.')
+        finally:
+            server.shutdown()
+            server.server_close()
+            server_thread.join()
+
+        self.assertEqual(requests[0][0], 'gzip', 'Large bulk body was not compressed.')
+        self.assertEqual([json.loads(line) for line in requests[0][2].splitlines()], actions, 'Compressed bulk body was not the expected one.')
+        self.assertEqual(requests[1][0], None, 'Bulk body smaller than the threshold was compressed.')
+        self.assertTrue('gzip' in requests[1][1], 'Compressed responses were not accepted.')
+
+    def test_connection_registry(self):
+        '''
+        Tests that clients are shared between searches with the same connection settings, and rebuilt in forked processes.
+        '''
+        es = Bungiesearch().get_es_instance()
+        self.assertTrue(Bungiesearch().get_es_instance() is es, 'Searches with the same settings do not share their client.')
+        self.assertTrue(Bungiesearch(urls=settings.BUNGIESEARCH['URLS'], timeout=settings.BUNGIESEARCH['TIMEOUT'], **settings.BUNGIESEARCH['ES_SETTINGS']).get_es_instance() is es,
+                        'Searches providing the connection settings do not share the client of the searches using them.')
+        self.assertFalse(Bungiesearch(maxsize=20).get_es_instance() is es, 'Searches with different settings share their client.')
+        self.assertTrue(Bungiesearch(maxsize=20).get_es_instance() is Bungiesearch(maxsize=20).get_es_instance(), 'Searches with the same provided settings do not share their client.')
+        new_es = Bungiesearch(force_new=True).get_es_instance()
+        self.assertFalse(new_es is es, 'Forcing a new connection returned the registered client.')
+        self.assertTrue(Bungiesearch().get_es_instance() is new_es, 'Forcing a new connection did not register the new client.')
+
+        if hasattr(os, 'fork'):
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                # The child must always exit here, instead of running the rest of the tests.
+                status = 2
+                try:
+                    child_es = Bungiesearch().get_es_instance()
+                    os.write(write_fd, b'1' if child_es is not new_es and Bungiesearch().get_es_instance() is child_es else b'0')
+                    status = 0
+                finally:
+                    os._exit(status)
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(status, 0, 'Forked process failed.')
+            self.assertEqual(os.read(read_fd, 1), b'1', 'Forked process did not build its own client.')
+            os.close(read_fd)
+            os.close(write_fd)
+            self.assertTrue(Bungiesearch().get_es_instance() is new_es, 'Parent process client changed after a fork.')
+
+    def test_settings_loading(self):
+        '''
+        Tests that loading the settings again, including from several threads or at startup, does not register indices twice.
+        '''
+        model_indices = dict((model_name, list(model_idx)) for model_name, model_idx in iteritems(Bungiesearch._model_name_to_model_idx))
+        threads = [Thread(target=Bungiesearch.__load_settings__) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        Bungiesearch.__load_settings__('bungiesearch_demo')
+        with override_settings(BUNGIESEARCH=dict(settings.BUNGIESEARCH, EAGER_LOAD=True)):
+            apps.get_app_config('bungiesearch').ready()
+        self.assertTrue(Bungiesearch.__loaded_indices__, 'All the indices were not loaded.')
+        self.assertEqual(dict(Bungiesearch._model_name_to_model_idx), model_indices, 'Loading the settings again registered model indices twice.')
+
+    def test_settings_loading_failure(self):
+        '''
+        Tests that an index which fails to load does not register any of its model indices, and is loaded again when next needed.
+        '''
+        model_indices = dict((model_name, list(model_idx)) for model_name, model_idx in iteritems(Bungiesearch._model_name_to_model_idx))
+        indices = Bungiesearch.BUNGIE['INDICES']
+        # A missing module, and a module whose ArticleIndex is a second default index of Article.
+        failing_indices = [('bungiesearch_missing', 'core.missing_indices', ImportError), ('bungiesearch_duplicate', 'core.search_indices', AttributeError)]
+        try:
+            Bungiesearch.__loaded_indices__ = False
+            for index_name, module_str, error in failing_indices:
+                indices[index_name] = module_str
+                for _ in range(2):
+                    self.assertRaises(error, Bungiesearch.__load_settings__, index_name)
+                self.assertNotIn(index_name, Bungiesearch._loaded_index_names, 'Index which failed to load was marked as loaded.')
+                self.assertNotIn(index_name, Bungiesearch._idx_name_to_mdl_to_mdlidx, 'Index which failed to load was registered.')
+            self.assertEqual(dict(Bungiesearch._model_name_to_model_idx), model_indices, 'Index which failed to load registered model indices.')
+        finally:
+            for index_name, _, _ in failing_indices:
+                indices.pop(index_name, None)
+            Bungiesearch.__load_settings__()
+        self.assertTrue(Bungiesearch.__loaded_indices__, 'All the indices were not loaded once the failing ones were removed.')
+
+    def test_single_flight(self):
+        '''
+        Tests that identical concurrent searches share a single request, and that searches return the same results with it.
+        '''
+        single_flight, started, release, calls = SingleFlight(), Event(), Event(), []
+        def request():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'hits': []}
+        leader = Thread(target=single_flight.do, args=('key', request))
+        leader.start()
+        started.wait(5)
+        follower = Thread(target=lambda: calls.append(single_flight.do('key', request)))
+        follower.start()
+        while not single_flight._calls['key'].waiters:
+            sleep(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(calls, [1, {'hits': []}], 'Concurrent identical calls did not share a single call.')
+
+        search = Article.objects.search.query('match', _all='Description')
+        with override_settings(BUNGIESEARCH=dict(settings.BUNGIESEARCH, SINGLE_FLIGHT={})):
+            self.assertEqual(search._clone().execute(), search._clone().execute(), 'Search with single flight did not return the same results.')
+
+    def test_mapping_source_filtering(self):
+        '''
+        Tests that the documents' source is only requested from elasticsearch when needed.
+        '''
+        search = Article.objects.search.query('match', _all='Description')
+        search.execute()
+        self.assertTrue(search.results, 'Searching for "Description" did not return any Article.')
+        self.assertTrue(all([dir(raw) == ['meta'] for raw in search.raw_results]), 'Mapped search requested the documents source.')
+        raw_items = Article.objects.search.query('match', _all='Description')[:5:True]
+        self.assertTrue(all(['title' in dir(raw) for raw in raw_items]), 'Raw search did not request the documents source.')
+
+    def test_mapping_threads(self):
+        '''
+        Tests that the mapping pool returns the fetched instances in the order of the jobs, and raises the errors of its threads.
+        Mapped searches within a transaction (as in tests) do not use the pool, so jobs are run on the pool directly.
+        '''
+        class DelayedQuerySet(object):
+            def __init__(self, delay, error=None):
+                self.delay, self.error = delay, error
+
+            def in_bulk(self, pks):
+                sleep(self.delay)
+                if self.error is not None:
+                    raise self.error
+                return dict((pk, self.delay) for pk in pks)
+
+        with override_settings(BUNGIESEARCH=dict(settings.BUNGIESEARCH, MAPPING_THREADS=3)):
+            pool = get_mapping_pool()
+            self.assertIsNotNone(pool, 'Setting MAPPING_THREADS did not create a mapping pool.')
+            fetched = pool.map(fetch_in_bulk, [(DelayedQuerySet(0.2), [1]), (DelayedQuerySet(0.1), [2, 3]), (DelayedQuerySet(0), [4])])
+            self.assertEqual(fetched, [{1: 0.2}, {2: 0.1, 3: 0.1}, {4: 0}], 'The mapping pool did not return the results in the order of the jobs.')
+            self.assertRaises(ValueError, pool.map, fetch_in_bulk, [(DelayedQuerySet(0.1), [1]), (DelayedQuerySet(0, ValueError('Failed fetch')), [2])])
+        self.assertIsNone(get_mapping_pool(), 'A mapping pool was returned without MAPPING_THREADS.')
+
+    def test_scan(self):
+        '''
+        Tests that scanning maps all the results, page by page.
+        '''
+        # Pages hold batch_size hits across all shards, whether sorted by index order or, with preserve_order, by the search sort.
+        for preserve_order in (False, True):
+            with self.assertNumQueries(Article.objects.count()):
+                scanned = [item.pk for item in Article.objects.search_index('bungiesearch_demo').scan(batch_size=1, preserve_order=preserve_order)]
+            self.assertEqual(sorted(scanned), sorted(Article.objects.values_list('pk', flat=True)), 'Scanning did not return all the Articles.')
+        self.assertTrue(isinstance(next(Article.objects.search_index('bungiesearch_demo').scan()), Article), 'Scanning did not map the results.')
+
+    def test_values_list(self):
+        '''
+        Tests that ids and values are returned without mapping the results.
+        '''
+        search = Article.objects.search_index('bungiesearch_demo').sort('id')
+        articles = sorted(Article.objects.all(), key=lambda article: article.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(search.ids()[:len(articles)], [str(article.pk) for article in articles], 'Unexpected search ids.')
+            self.assertEqual(search.values_list('title', '_id')[:len(articles)], [(article.title, str(article.pk)) for article in articles], 'Unexpected search values.')
+            self.assertEqual(search.values_list('title', flat=True)[0], articles[0].title, 'Unexpected flat search value.')
+            self.assertEqual(sorted(search.ids().scan()), sorted(str(article.pk) for article in articles), 'Scanning ids did not return all the ids.')
+        self.assertRaises(TypeError, search.values_list, 'title', '_id', flat=True)
+
+    def test_cursor_pagination(self):
+        '''
+        Tests that cursor pagination returns all the results once, and that the paginator does not send count requests.
+        '''
+        search = Article.objects.search_index('bungiesearch_demo').sort('-tweet_count')
+        page = search.cursor_page(size=1)
+        paginated = [item.pk for item in page]
+        while page.has_next:
+            page = search.cursor_page(page.next_cursor, size=1)
+            paginated.extend(item.pk for item in page)
+        self.assertEqual(sorted(paginated), sorted(Article.objects.values_list('pk', flat=True)), 'Cursor pagination did not return each Article once.')
+
+        scored = Article.objects.search_index('bungiesearch_demo').query('match', _all='Description').sort('_score')
+        if supports_search_after(scored.get_es_instance()):
+            self.assertEqual(len(scored.cursor_page(size=1)), 1, 'Cursor pagination sorted by _score did not return a single item.')
+        else:
+            self.assertRaises(ValueError, scored.cursor_page, size=1)
+
+        paginator = SearchPaginator(Article.objects.search_index('bungiesearch_demo').sort('id'), 1)
+        self.assertEqual(len(paginator.page(2)), 1, 'Paginator did not return a single item on the second page.')
+        self.assertEqual(paginator.count, Article.objects.count(), 'Paginator did not count all the Articles.')
+
+    def test_multi_search(self):
+        '''
+        Tests that searches executed together return the same results as when executed separately, in order.
+        '''
+        searches = [Article.objects.search.query('match', _all='Description'), User.objects.search.query('match', _all='Description'),
+                    Article.objects.search.query('match', _all='second article')]
+        expected = [list(search._clone()) for search in searches]
+        self.assertEqual(Bungiesearch.multi(searches), expected, 'Multi search did not return the results of each search.')
+        self.assertEqual(searches[1].results, expected[1], 'Multi search did not store the results of each search.')
+
+    @skipIf(sys.version_info < (3, 5), 'Asyncio support requires Python 3.5 or later.')
+    def test_async(self):
+        '''
+        Tests that searches can be counted and executed concurrently from an event loop.
+        '''
+        from asyncio import gather, get_event_loop
+        search = Article.objects.search.query('match', _all='Description')
+        raw_search = Bungiesearch(raw_results=True).index('bungiesearch_demo').doc_type('Article').query('match', _all='Description')
+        count, raw_results = get_event_loop().run_until_complete(gather(search.count_async(), raw_search.execute_async()))
+        self.assertEqual(count, search.count(), 'Asynchronous count did not return the number of hits.')
+        self.assertEqual(raw_results.hits.total, count, 'Asynchronous search did not return the expected hits.')
+
     def test_fields(self):
         '''
         Checking that providing a specific field will correctly fetch these items from elasticsearch.